@@ -1,22 +1,222 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from typing import Iterable, Literal
 import fdb
 import pyodbc
 import logging
-import sys
+import threading
+import time
 
 from config import DatabaseConfig, FirebirdDatabaseConfig, MssqlDatabaseConfig
 
 
+class DatabaseConnectionError(Exception):
+    """
+    Die Verbindung zu einer Datenbank konnte nicht hergestellt werden (oder die Datenbank ist nicht konfiguriert).
+    """
+
+
+class ConnectionPool:
+    """
+    Prozessweiter Pool freigegebener Datenbankverbindungen, geordnet nach Datenbank-Konfiguration.
+    Eine Verbindung wird wiederverwendet, wenn sie höchstens `pool_max_idle_seconds` ungenutzt war und ein
+    kurzer Ping gelingt; andernfalls wird sie verworfen und neu verbunden.
+    Der Zeitzonen-Versatz der Datenbank wird pro Verbindung zwischengespeichert und bleibt mit ihr im Pool.
+    """
+
+    def __init__(self):
+        self._idle: dict[str, list[tuple[float, fdb.Connection | pyodbc.Connection]]] = {}
+        self._time_zones: dict[int, TimeZoneCache] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, db_name: str, db_config: DatabaseConfig, connect):
+        """
+        Liefert (Verbindung, wiederverwendet); `connect` baut bei Bedarf eine neue Verbindung auf.
+        """
+        key = db_config.model_dump_json()
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                entry = idle.pop() if idle else None
+            if entry is None:
+                return connect(), False
+            released_at, conn = entry
+            if time.monotonic() - released_at > db_config.pool_max_idle_seconds:
+                logging.debug(f"Ungenutzte Verbindung zur Datenbank '{db_name}' ist abgelaufen.")
+            elif ping(conn):
+                logging.info(f"Verbindung zur Datenbank '{db_name}' aus dem Pool wiederverwendet.")
+                return conn, True
+            else:
+                logging.warning(f"Verbindung zur Datenbank '{db_name}' antwortet nicht mehr, verbinde neu.")
+            self.discard(conn)
+
+    def release(self, db_config: DatabaseConfig, conn: fdb.Connection | pyodbc.Connection):
+        if db_config.pool_max_idle_seconds <= 0:
+            self.discard(conn)
+            return
+        try:
+            # Offene Transaktion (bei Firebird auch ein alter Snapshot) nicht in den nächsten Run mitnehmen
+            conn.rollback()
+        except Exception:
+            self.discard(conn)
+            return
+        with self._lock:
+            self._idle.setdefault(db_config.model_dump_json(), []).append((time.monotonic(), conn))
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+            self._time_zones = {}
+        for entries in idle.values():
+            for _, conn in entries:
+                close_quietly(conn)
+
+    def discard(self, conn: fdb.Connection | pyodbc.Connection):
+        """
+        Schließt eine Verbindung, die nicht wiederverwendet wird, und verwirft ihren Zeitzonen-Versatz.
+        """
+        with self._lock:
+            self._time_zones.pop(id(conn), None)
+        close_quietly(conn)
+
+    def get_time_zone(self, conn: fdb.Connection | pyodbc.Connection) -> timedelta | None:
+        with self._lock:
+            cache = self._time_zones.get(id(conn))
+            if cache is None:
+                cache = self._time_zones[id(conn)] = TimeZoneCache(conn)
+        return cache.get()
+
+
+# Höchstalter des zwischengespeicherten Zeitzonen-Versatzes: die Datenbank kann die Uhr unabhängig vom Sync-Host
+# umstellen (z. B. Host in UTC), Umstellungen erfolgen zur vollen Stunde
+TIME_ZONE_MAX_AGE_SECONDS = 3600
+
+
+class TimeZoneCache:
+    """
+    Zeitzonen-Versatz einer Verbindung (siehe `get_time_zone`), nicht pro Task abgefragt. Neu abgefragt wird nach
+    `TIME_ZONE_MAX_AGE_SECONDS` oder sobald sich der lokale UTC-Versatz geändert hat (Sommer-/Winterzeit).
+    """
+
+    def __init__(self, conn: fdb.Connection | pyodbc.Connection):
+        self.conn = conn
+        self.delta: timedelta | None = None
+        self._local_offset: timedelta | None = None
+        self._queried_at = 0.0
+
+    def get(self) -> timedelta | None:
+        local_offset = local_utc_offset()
+        if (
+            self.delta is None
+            or local_offset != self._local_offset
+            or time.monotonic() - self._queried_at > TIME_ZONE_MAX_AGE_SECONDS
+        ):
+            self.delta = get_time_zone(self.conn)
+            self._local_offset = local_offset
+            self._queried_at = time.monotonic()
+        return self.delta
+
+
+def local_utc_offset() -> timedelta:
+    return datetime.now().astimezone().utcoffset()
+
+
+def ping(conn: fdb.Connection | pyodbc.Connection) -> bool:
+    sql = "SELECT 1 FROM RDB$DATABASE" if isinstance(conn, fdb.Connection) else "SELECT 1"
+    try:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql)
+            cursor.fetchone()
+        finally:
+            cursor.close()
+        return True
+    except Exception:
+        return False
+
+
+def close_quietly(conn: fdb.Connection | pyodbc.Connection):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
 class DatabaseConnection:
-    def __init__(self, database_configs: dict[str, DatabaseConfig]):
+    """
+    Verbindungen zu den konfigurierten Datenbanken. Eine Verbindung wird erst bei der ersten Nutzung geöffnet;
+    `connect` öffnet mehrere benötigte Verbindungen gleichzeitig. Schlägt eine Verbindung fehl, betrifft das nur die
+    Tasks dieser Datenbank: `get_connection` wirft dann `DatabaseConnectionError`.
+    """
+
+    def __init__(self, database_configs: dict[str, DatabaseConfig], pool: ConnectionPool | None = None):
         self.config = database_configs
         self.connections: dict[str, fdb.Connection | pyodbc.Connection] = {}
-        if self.config:
-            for db_name, db_config in self.config.items():
-                if db_config.type == "firebird":
-                    self.connections[db_name] = self._connect_firebird(db_name, db_config)
-                elif db_config.type == "mssql":
-                    self.connections[db_name] = self._connect_mssql(db_name, db_config)
+        self.errors: dict[str, DatabaseConnectionError] = {}
+        # Ohne gemeinsamen Pool (z. B. einmaliger Sync über die CLI) werden die Verbindungen am Ende geschlossen
+        self.pool = pool or ConnectionPool()
+        self._own_pool = pool is None
+        self.stats = {"connects": 0, "reuses": 0, "connect_seconds": 0.0}
+        self._lock = threading.Lock()
+        self._db_locks: dict[str, threading.Lock] = {}
+
+    def connect(self, db_names: Iterable[str]):
+        """
+        Öffnet die Verbindungen zu den angegebenen Datenbanken gleichzeitig. Fehler werden pro Datenbank gemerkt
+        und beim Abruf über `get_connection` geworfen.
+        """
+        pending = [db_name for db_name in dict.fromkeys(db_names) if db_name not in self.connections]
+        if len(pending) < 2:
+            for db_name in pending:
+                self._try_open(db_name)
+            return
+        with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+            list(executor.map(self._try_open, pending))
+
+    def _try_open(self, db_name: str):
+        try:
+            self._open(db_name)
+        except DatabaseConnectionError:
+            pass
+
+    def _open(self, db_name: str):
+        with self._lock:
+            db_lock = self._db_locks.setdefault(db_name, threading.Lock())
+        with db_lock:
+            if db_name in self.connections:
+                return self.connections[db_name]
+            if db_name in self.errors:
+                raise self.errors[db_name]
+            db_config = (self.config or {}).get(db_name)
+            try:
+                if db_config is None:
+                    raise DatabaseConnectionError(f"Datenbank '{db_name}' nicht gefunden.")
+                connect = self._connect_firebird if db_config.type == "firebird" else self._connect_mssql
+                conn = self._acquire(db_name, db_config, connect)
+            except DatabaseConnectionError as e:
+                logging.error(e)
+                self.errors[db_name] = e
+                raise
+            self.connections[db_name] = conn
+            return conn
+
+    def _acquire(self, db_name: str, db_config: DatabaseConfig, connect):
+        started = time.monotonic()
+        conn, reused = self.pool.acquire(db_name, db_config, lambda: connect(db_name, db_config))
+        with self._lock:
+            if reused:
+                self.stats["reuses"] += 1
+            else:
+                self.stats["connects"] += 1
+                self.stats["connect_seconds"] += time.monotonic() - started
+        return conn
+
+    def get_stats(self):
+        """
+        Anzahl neu aufgebauter und aus dem Pool wiederverwendeter Verbindungen sowie die Dauer des Verbindungsaufbaus.
+        """
+        with self._lock:
+            return dict(self.stats)
 
     def _connect_firebird(self, db_name: str, db_config: FirebirdDatabaseConfig):
         try:
@@ -28,39 +228,52 @@ class DatabaseConnection:
                 password=db_config.password,
                 charset=db_config.charset,
             )
-            logging.info(f"Verbindung zur Firebird-Datenbank '{db_name}' hergestellt.")
-            get_time_zone(conn)
-            return conn
         except Exception as e:
-            logging.error(f"Fehler bei der Verbindung zur Firebird-Datenbank '{db_name}': {e}")
-            sys.exit(1)
+            raise DatabaseConnectionError(f"Fehler bei der Verbindung zur Firebird-Datenbank '{db_name}': {e}") from e
+        logging.info(f"Verbindung zur Firebird-Datenbank '{db_name}' hergestellt.")
+        return conn
 
     def _connect_mssql(self, db_name: str, db_config: MssqlDatabaseConfig):
+        mssql_conn_str = (
+            f"DRIVER={{ODBC Driver 18 for SQL Server}};"
+            f"SERVER={db_config.server};"
+            f"DATABASE={db_config.database};"
+            f"UID={db_config.user};"
+            f"PWD={db_config.password};"
+            f"TrustServerCertificate={'yes' if db_config.trust_server_certificate else 'no'}"
+        )
         try:
-            mssql_conn_str = (
-                f"DRIVER={{ODBC Driver 18 for SQL Server}};"
-                f"SERVER={db_config.server};"
-                f"DATABASE={db_config.database};"
-                f"UID={db_config.user};"
-                f"PWD={db_config.password};"
-                f"TrustServerCertificate={'yes' if db_config.trust_server_certificate else 'no'}"
-            )
             conn = pyodbc.connect(mssql_conn_str, autocommit=False)
-            logging.info(f"Verbindung zur MSSQL-Datenbank '{db_name}' hergestellt.")
-            get_time_zone(conn)
-            return conn
         except Exception as e:
-            logging.error(f"Fehler bei der Verbindung zur MSSQL-Datenbank '{db_name}': {e}")
-
-            sys.exit(1)
+            raise DatabaseConnectionError(f"Fehler bei der Verbindung zur MSSQL-Datenbank '{db_name}': {e}") from e
+        logging.info(f"Verbindung zur MSSQL-Datenbank '{db_name}' hergestellt.")
+        return conn
 
     def get_connection(self, db_name: str):
+        """
+        Verbindung zur Datenbank, beim ersten Aufruf wird sie geöffnet. Wirft `DatabaseConnectionError`.
+        """
         conn = self.connections.get(db_name)
         if conn:
             return conn
-        else:
-            logging.error(f"Datenbank '{db_name}' nicht gefunden.")
-            return None
+        return self._open(db_name)
+
+    def get_time_zone(self, db_name: str) -> timedelta | None:
+        """
+        Zeitzonen-Versatz der Datenbank; wird pro Verbindung nur einmal abgefragt, nicht pro Task.
+        """
+        return self.pool.get_time_zone(self.get_connection(db_name))
+
+    def use_fast_executemany(self, db_name: str) -> bool:
+        db_config = (self.config or {}).get(db_name)
+        return db_config is not None and db_config.type == "mssql" and db_config.fast_executemany
+
+    def get_dialect(self, db_name: str):
+        """
+        SQL-Dialekt der Datenbank (`mssql` oder `firebird`), ohne die Verbindung zu öffnen.
+        """
+        db_config = (self.config or {}).get(db_name)
+        return db_config.type if db_config else None
 
     def get_escape_identifier_fn(self, db_name: str):
         if self.config:
@@ -76,8 +289,212 @@ class DatabaseConnection:
 
     def close_connections(self):
         for db_name, conn in self.connections.items():
-            conn.close()
-            logging.info(f"Verbindung zur Datenbank '{db_name}' geschlossen.")
+            if self._own_pool:
+                self.pool.discard(conn)
+                logging.info(f"Verbindung zur Datenbank '{db_name}' geschlossen.")
+            else:
+                self.pool.release(self.config[db_name], conn)
+                logging.info(f"Verbindung zur Datenbank '{db_name}' an den Pool zurückgegeben.")
+        self.connections = {}
+
+
+CommitPolicy = Literal["statement", "batch", "run"]
+
+# Name des Savepoints, auf den ein fehlgeschlagener Block innerhalb einer offenen Transaktion zurückgerollt wird
+BATCH_SAVEPOINT = "batch_writer"
+
+
+class BatchWriter:
+    """
+    Sammelt Schreibzugriffe und führt Anweisungen mit demselben SQL (also derselben Spaltenliste) gemeinsam per
+    `executemany` aus. Auf MSSQL überträgt pyodbc mit `fast_executemany` alle Parametersätze in einem Roundtrip,
+    auf Firebird wird die Anweisung einmal vorbereitet und mit allen Parametersätzen ausgeführt.
+
+    Committet wird je nach `commit_policy` nach jeder Anweisung bzw. jedem Block (`statement`), sobald
+    `commit_every` Datensätze geschrieben sind (`batch`) oder erst über `commit()` am Ende des Runs (`run`).
+    Schlägt ein Block fehl, wird nur er zurückgerollt (in einer offenen Transaktion auf einen Savepoint) und
+    Zeile für Zeile wiederholt, damit nur der fehlerhafte Datensatz verloren geht und im Log erscheint.
+    """
+
+    def __init__(
+        self,
+        conn: fdb.Connection | pyodbc.Connection,
+        db_name: str,
+        batch_size: int,
+        dry_run: bool = False,
+        fast_executemany: bool = False,
+        dialect: str = "mssql",
+        commit_policy: CommitPolicy = "statement",
+        commit_every: int = 1000,
+    ):
+        self.conn = conn
+        self.db_name = db_name
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.fast_executemany = fast_executemany
+        self.dialect = dialect
+        self.commit_policy = commit_policy
+        self.commit_every = commit_every
+        # Geschriebene, noch nicht committete Datensätze
+        self.uncommitted = 0
+        # Anweisungen in der Reihenfolge ihres ersten Auftretens, je SQL die Parametersätze und die Erfolgsmeldung
+        self._groups: dict[str, tuple[list[list], str]] = {}
+        self._keys: set = set()
+        self._pending = 0
+
+    def add(self, sql: str, params: list, success_msg: str, key=None):
+        """
+        Merkt eine Anweisung vor. Anweisungen mit demselben `key` (z. B. die Werte der WHERE-Bedingung) werden
+        in Aufrufreihenfolge ausgeführt: vor dem zweiten Schreibzugriff auf einen Datensatz wird ausgeführt.
+        """
+        if key is not None:
+            if key in self._keys:
+                self.flush()
+            self._keys.add(key)
+        self._groups.setdefault(sql, ([], success_msg))[0].append(params)
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        groups, self._groups = self._groups, {}
+        self._keys = set()
+        self._pending = 0
+        for sql, (rows, success_msg) in groups.items():
+            self._execute(sql, rows, success_msg)
+
+    def commit(self):
+        """
+        Schreibt vorgemerkte Anweisungen und committet die offene Transaktion.
+        """
+        self.flush()
+        if self.uncommitted and not self.dry_run:
+            self.conn.commit()
+            logging.debug(f"{self.uncommitted} Datensätze in {self.db_name} committet.")
+        self.uncommitted = 0
+
+    def rollback(self):
+        """
+        Verwirft vorgemerkte Anweisungen und rollt die offene Transaktion zurück.
+        """
+        self._groups = {}
+        self._keys = set()
+        self._pending = 0
+        if self.uncommitted:
+            logging.warning(f"{self.uncommitted} nicht committete Datensätze in {self.db_name} werden zurückgerollt.")
+        if not self.dry_run:
+            self.conn.rollback()
+        self.uncommitted = 0
+
+    def _execute(self, sql: str, rows: list[list], success_msg: str):
+        if self.dry_run:
+            for params in rows:
+                logging.info(f"DRY_RUN: {self.db_name}\n{format_query(sql, params)}")
+            return
+        logging.debug(f"Anfrage an {self.db_name} ({len(rows)} Datensätze)\n{format_query(sql, rows[0])}")
+        # Nur in einer Transaktion mit bereits geschriebenen Datensätzen ist ein Savepoint nötig
+        in_transaction = self.uncommitted > 0
+        cursor = self.conn.cursor()
+        try:
+            if in_transaction:
+                self._savepoint(cursor)
+            if len(rows) == 1:
+                cursor.execute(sql, rows[0])
+            else:
+                if self.fast_executemany:
+                    cursor.fast_executemany = True
+                cursor.executemany(sql, rows)
+        except Exception as e:
+            self._rollback_failed(cursor, in_transaction)
+            if len(rows) == 1:
+                logging.error(f"Fehler beim Ausführen der Query '{format_query(sql, rows[0])}'\n{e}")
+                return
+            logging.warning(f"Sammelschreibvorgang mit {len(rows)} Datensätzen fehlgeschlagen, wiederhole einzeln: {e}")
+            for params in rows:
+                self._execute(sql, [params], success_msg)
+            return
+        finally:
+            cursor.close()
+        logging.info(success_msg if len(rows) == 1 else f"{success_msg} (Anzahl: {len(rows)})")
+        self._written(len(rows))
+
+    def execute_block(self, fn, rows: int):
+        """
+        Führt `fn(cursor)` nach den vorgemerkten Anweisungen als einen Block aus (z. B. Staging-Tabelle und MERGE):
+        in einer offenen Transaktion mit Savepoint, Commit gemäß `commit_policy`. Bei einem Fehler wird nur der Block
+        zurückgerollt und die Exception weitergereicht.
+        """
+        self.flush()
+        in_transaction = self.uncommitted > 0
+        cursor = self.conn.cursor()
+        try:
+            if in_transaction:
+                self._savepoint(cursor)
+            result = fn(cursor)
+        except Exception:
+            self._rollback_failed(cursor, in_transaction)
+            raise
+        finally:
+            cursor.close()
+        self._written(rows)
+        return result
+
+    def _written(self, rows: int):
+        self.uncommitted += rows
+        if self.commit_policy == "statement" or (
+            self.commit_policy == "batch" and self.uncommitted >= self.commit_every
+        ):
+            self.conn.commit()
+            self.uncommitted = 0
+
+    def _savepoint(self, cursor):
+        if self.dialect == "firebird":
+            cursor.execute(f"SAVEPOINT {BATCH_SAVEPOINT}")
+        else:
+            cursor.execute(f"SAVE TRANSACTION {BATCH_SAVEPOINT}")
+
+    def _rollback_failed(self, cursor, in_transaction: bool):
+        if in_transaction:
+            try:
+                if self.dialect == "firebird":
+                    cursor.execute(f"ROLLBACK TO SAVEPOINT {BATCH_SAVEPOINT}")
+                else:
+                    cursor.execute(f"ROLLBACK TRANSACTION {BATCH_SAVEPOINT}")
+                return
+            except Exception as e:
+                # z. B. wenn MSSQL die Transaktion nach dem Fehler nur noch vollständig zurückrollen kann
+                logging.error(
+                    f"Rollback auf Savepoint fehlgeschlagen, {self.uncommitted} nicht committete Datensätze "
+                    f"in {self.db_name} gehen verloren: {e}"
+                )
+        self.conn.rollback()
+        self.uncommitted = 0
+
+
+# Dialekte, in denen INSERT/UPDATE die geschriebenen Zeilen direkt zurückgeben können
+RETURNING_DIALECTS = {"mssql", "firebird"}
+
+
+def get_returning_clauses(dialect: str, columns: list[str]) -> tuple[str, str]:
+    """
+    Klauseln, mit denen eine schreibende Anweisung die geschriebenen Zeilen im selben Roundtrip liefert:
+    MSSQL `OUTPUT INSERTED.<Spalten>` (vor VALUES bzw. WHERE), Firebird `RETURNING <Spalten>` (am Ende).
+    Liefert (vorne, hinten); die Spaltennamen müssen bereits maskiert sein.
+    """
+    if dialect == "mssql":
+        return " OUTPUT " + ", ".join(f"INSERTED.{column}" for column in columns), ""
+    if dialect == "firebird":
+        return "", " RETURNING " + ", ".join(columns)
+    raise ValueError(f"Dialekt {dialect} unterstützt keine Rückgabe geschriebener Zeilen.")
+
+
+def is_returning_unsupported(error: Exception) -> bool:
+    """
+    Ob die Datenbank die Rückgabe geschriebener Zeilen abgelehnt hat: MSSQL erlaubt OUTPUT ohne INTO nicht auf
+    Tabellen mit aktiven Triggern (Fehler 334).
+    """
+    message = str(error)
+    return "(334)" in message or "OUTPUT clause without INTO" in message
 
 
 def get_time_zone(db_conn: fdb.Connection | pyodbc.Connection):
@@ -1,59 +1,147 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import logging
-from typing import Literal
+import threading
+import time
+from typing import Callable, Iterator, Literal, Mapping
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import quote_plus, urlencode
 import json
-from datetime import datetime, date
-from decimal import Decimal
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from zoneinfo import ZoneInfo
 
+from api.json_codec import get_json_codec
 from config import FrappeAuthConfig, FrappeConfig
+from utils.history_db import TaskHistoryDB
+from utils.rows import Row, decode_rows
+
+RETRY_STATUS_CODES = (502, 503, 504)
+# 429 wird nicht von urllib3, sondern vom RateLimiter behandelt (auch für POST, da nichts verarbeitet wurde)
+THROTTLED_STATUS_CODE = 429
+# frappe.client.insert_many akzeptiert höchstens 200 Dokumente pro Aufruf
+INSERT_MANY_LIMIT = 200
+# Felder, die jeder DocType hat, die aber nicht in den DocType-Metadaten stehen
+STANDARD_FIELDS = {"name", "owner", "creation", "modified", "modified_by", "docstatus", "idx"}
+
+
+class FrappeFetchError(Exception):
+    """
+    Eine Seite konnte auch nach Wiederholungen nicht abgerufen werden. Der Abruf wird abgebrochen, statt eine
+    unvollständige Liste zu liefern (fehlende Datensätze würden sonst als gelöscht gelten).
+    """
 
 
 class FrappeAPI:
-    def __init__(self, config: FrappeConfig, dry_run: bool):
+    def __init__(self, config: FrappeConfig, dry_run: bool, metadata_cache: TaskHistoryDB | None = None):
         self.config = config
         self.headers = {"Accept": "application/json"}
         self._setup_auth(config)
         self.dry_run = dry_run
-        self.tz_delta = self.get_time_zone()
+        self.session = self._create_session(config)
+        self.json_codec = get_json_codec(config.json_codec)
+        self.request_count = 0
+        self._stats_lock = threading.Lock()
+        self.page_sizer = PageSizer(config)
+        self.rate_limiter = RateLimiter(config.rate_limit_per_second, config.rate_limit_burst)
+        # Zeitzone und DocType-Felder werden im History-DB zwischengespeichert (meta_cache_ttl_seconds)
+        self.metadata_cache = metadata_cache
+        self.time_zone_name = self.get_time_zone_name()
+
+    def _create_session(self, config: FrappeConfig):
+        # Eine Session pro Instanz: Verbindungen bleiben offen (Keep-Alive) und werden wiederverwendet.
+        # Bei 502/503/504 werden nur idempotente Methoden wiederholt (kein POST),
+        # damit keine Dokumente doppelt angelegt werden.
+        retry = Retry(
+            total=config.max_retries,
+            backoff_factor=config.retry_backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _request(self, method: str, endpoint: str, **kwargs):
+        timeout = (self.config.connect_timeout_seconds, self.config.read_timeout_seconds)
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            with self._stats_lock:
+                self.request_count += 1
+            response = self.session.request(method, endpoint, timeout=timeout, **kwargs)
+            if response.status_code != THROTTLED_STATUS_CODE or attempt >= self.config.max_retries:
+                return response
+            wait_seconds = parse_retry_after(response.headers.get("Retry-After"))
+            if wait_seconds is None:
+                wait_seconds = self.config.retry_backoff_factor * (2**attempt)
+            logging.warning(f"Frappe-Ratenlimit erreicht (429), warte {wait_seconds:.1f}s vor {method} {endpoint}.")
+            # Alle Threads pausieren, nicht nur der gedrosselte Request
+            self.rate_limiter.pause(wait_seconds)
+            attempt += 1
+
+    def _parse_json(self, response: requests.Response):
+        try:
+            return self.json_codec.loads(response.content)
+        except ValueError as e:
+            # Wie response.json() als RequestException melden, damit die Aufrufer den Fehler behandeln
+            raise requests.exceptions.JSONDecodeError(str(e), "", 0) from e
+
+    def get_stats(self):
+        """
+        Anzahl der gesendeten Requests, der dafür geöffneten Verbindungen und die Wartezeit durch Drosselung.
+        """
+        connections = 0
+        for adapter in self.session.adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    connections += pool.num_connections
+        return {
+            "requests": self.request_count,
+            "connections": connections,
+            "throttle_wait_seconds": self.rate_limiter.wait_seconds,
+        }
+
+    def close(self):
+        self.session.close()
 
     def _setup_auth(self, auth_config: FrappeAuthConfig):
         api_key = auth_config.api_key
         api_secret = auth_config.api_secret
         self.headers["Authorization"] = f"token {api_key}:{api_secret}"
 
-    def _send_data(self, method: Literal["PUT", "POST"], endpoint: str, data: dict):
+    def _send_data(self, method: Literal["PUT", "POST"], endpoint: str, data: dict, raise_errors=False):
         try:
-            # To old modified date leads to 413 frappe.exceptions.TimestampMismatchError and frappe overrides it anyway
-            if "modified" in data:
-                data.pop("modified")
-            # sending creation date leads to 417 frappe.exceptions.CannotChangeConstantError and frappe overrides it anyway
-            if "creation" in data:
-                data.pop("creation")
-            json_data = json.dumps(data, cls=CustomEncoder)
+            remove_readonly_fields(data)
+            json_data = self.json_codec.dumps(data)
             if self.dry_run:
                 logging.info(
                     f"""DRY_RUN: {method} {endpoint}
-                        {json_data}"""
+                        {json_data.decode()}"""
                 )
                 return {"data": {}}
             headers = self.headers.copy()
             headers["Content-Type"] = "application/json"
-            if method == "POST":
-                response = requests.post(endpoint, data=json_data, headers=headers)
-            elif method == "PUT":
-                response = requests.put(endpoint, data=json_data, headers=headers)
-            else:
+            if method not in ("POST", "PUT"):
                 logging.error(f"Unbekannte HTTP-Methode: {method}")
                 return None
+            response = self._request(method, endpoint, data=json_data, headers=headers)
             response.raise_for_status()
             logging.info(f"Daten erfolgreich an {method} {endpoint} gesendet.")
-            logging.debug(f"{json_data}")
-            return response.json()
+            logging.debug(json_data.decode())
+            return self._parse_json(response)
         except requests.exceptions.RequestException as e:
             logging.error(f"Fehler beim Senden der Daten an {method} {endpoint}: {e}")
-            logging.error(f"{json_data}")
+            logging.error(json_data.decode())
+            if raise_errors:
+                raise
             return None
 
     def insert_data(self, doc_type: str, data):
@@ -62,6 +150,124 @@ class FrappeAPI:
     def update_data(self, doc_type: str, doc_name: str, data):
         return self._send_data("PUT", self.get_endpoint(doc_type, doc_name), data)
 
+    def insert_many(
+        self,
+        doc_type: str,
+        docs: list[dict],
+        key_fields: list[str] | None = None,
+        key_fn: Callable[[Mapping], tuple | None] | None = None,
+    ):
+        """
+        Fügt Dokumente gesammelt über frappe.client.insert_many ein.
+        Liefert pro Dokument eine Antwort wie insert_data (oder None bei Fehler). Die Namen gesammelt angelegter
+        Dokumente werden über `key_fields` zugeordnet (`key_fn` bildet den Vergleichsschlüssel eines Dokuments);
+        ohne `key_fields` enthält die Antwort keinen Namen.
+        """
+        results = [None] * len(docs)
+        positions = list(range(len(docs)))
+        if key_fields:
+            # Ohne vollständigen Schlüssel lässt sich der Name nicht zuordnen: einzeln einfügen
+            keyed = [i for i in positions if key_fn(docs[i]) is not None]
+            for i in sorted(set(positions) - set(keyed)):
+                results[i] = self.insert_data(doc_type, docs[i])
+            positions = keyed
+        for chunk in chunks(positions, min(self.config.write_batch_size, INSERT_MANY_LIMIT)):
+            chunk_results = self._insert_chunk(doc_type, [docs[i] for i in chunk], key_fields, key_fn)
+            for i, res in zip(chunk, chunk_results):
+                results[i] = res
+        return results
+
+    def _insert_chunk(self, doc_type: str, docs: list[dict], key_fields=None, key_fn=None):
+        if self.dry_run or len(docs) == 1:
+            return [self.insert_data(doc_type, doc) for doc in docs]
+        payload = [{**remove_readonly_fields(dict(doc)), "doctype": doc_type} for doc in docs]
+        endpoint = self.get_method_endpoint("frappe.client.insert_many")
+        try:
+            res = self._send_data(
+                "POST", endpoint, {"docs": self.json_codec.dumps(payload).decode()}, raise_errors=True
+            )
+        except requests.exceptions.RequestException as e:
+            if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+                # Frappe hat den Sammel-Insert abgelehnt (eine Transaktion, nichts angelegt):
+                # einzeln einfügen, um den Fehler einem Dokument zuzuordnen
+                logging.warning(f"Sammel-Insert für {doc_type} abgelehnt, füge {len(docs)} Dokumente einzeln ein.")
+                return [self.insert_data(doc_type, doc) for doc in docs]
+            # Timeout oder Verbindungsabbruch: Die Dokumente können bereits angelegt sein, daher nicht erneut senden
+            res = None
+        names = res.get("message") if res else None
+        if isinstance(names, list) and len(names) == len(docs):
+            logging.info(f"{len(docs)} {doc_type}-Dokumente gesammelt eingefügt.")
+            return self._match_inserted_names(doc_type, docs, names, key_fields, key_fn)
+        logging.error(
+            f"Sammel-Insert für {doc_type} ohne gültige Antwort, {len(docs)} Dokumente werden nicht erneut gesendet."
+        )
+        return [None] * len(docs)
+
+    def _match_inserted_names(self, doc_type: str, docs: list[dict], names: list[str], key_fields, key_fn):
+        """
+        frappe.client.insert_many sammelt die Namen in einem Set, ihre Reihenfolge entspricht nicht der der
+        Dokumente. Die Namen werden daher mit den Schlüsselfeldern erneut gelesen und über den Schlüssel zugeordnet.
+        """
+        if not key_fields:
+            return [{"data": {}} for _ in docs]
+        index: dict[tuple, list[str]] = {}
+        for row in self.iter_rows_by_values(doc_type, "name", names, list(dict.fromkeys(["name", *key_fields]))):
+            index.setdefault(key_fn(row), []).append(row["name"])
+        results = []
+        for doc in docs:
+            matches = index.get(key_fn(doc))
+            if matches:
+                results.append({"data": {"name": matches.pop(0)}})
+            else:
+                logging.error(f"Angelegtes {doc_type}-Dokument konnte keinem Namen zugeordnet werden: {doc}")
+                results.append({"data": {}})
+        return results
+
+    def update_many(self, doc_type: str, updates: list[tuple[str, dict]]):
+        """
+        Aktualisiert Dokumente gesammelt über frappe.client.bulk_update.
+        `updates` enthält Paare aus Dokumentname und Daten.
+        Liefert pro Dokument eine Antwort wie update_data (oder None bei Fehler).
+        """
+        results = []
+        for chunk in chunks(updates, self.config.write_batch_size):
+            results.extend(self._update_chunk(doc_type, chunk))
+        return results
+
+    def _update_chunk(self, doc_type: str, updates: list[tuple[str, dict]]):
+        if self.dry_run or len(updates) == 1:
+            return [self.update_data(doc_type, doc_name, data) for doc_name, data in updates]
+        payload = [
+            {**remove_readonly_fields(dict(data)), "doctype": doc_type, "docname": doc_name}
+            for doc_name, data in updates
+        ]
+        endpoint = self.get_method_endpoint("frappe.client.bulk_update")
+        res = self._send_data("POST", endpoint, {"docs": self.json_codec.dumps(payload).decode()})
+        message = res.get("message") if res else None
+        if not isinstance(message, dict):
+            logging.warning(
+                f"Sammel-Update für {doc_type} fehlgeschlagen, aktualisiere {len(updates)} Dokumente einzeln."
+            )
+            return [self.update_data(doc_type, doc_name, data) for doc_name, data in updates]
+        failed_names = set()
+        for failed in message.get("failed_docs") or []:
+            doc_name = failed.get("doc", {}).get("docname")
+            failed_names.add(doc_name)
+            exc = (failed.get("exc") or "").strip().splitlines()
+            logging.error(f"Fehler beim Aktualisieren von {doc_type} {doc_name}: {exc[-1] if exc else 'unbekannt'}")
+        logging.info(f"{len(updates) - len(failed_names)} {doc_type}-Dokumente gesammelt aktualisiert.")
+        return [None if doc_name in failed_names else {"data": {"name": doc_name}} for doc_name, _ in updates]
+
+    def delete_many(self, doc_type: str, doc_names: list[str]):
+        """
+        Löscht Dokumente blockweise. Frappe bietet keinen synchronen Sammel-Endpunkt zum Löschen,
+        daher wird frappe.client.delete pro Dokument über die offene Verbindung aufgerufen.
+        """
+        results = []
+        for chunk in chunks(doc_names, self.config.write_batch_size):
+            results.extend(self.delete(doc_type, doc_name) for doc_name in chunk)
+        return results
+
     def get_data(
         self,
         doc_type: str,
@@ -76,30 +282,337 @@ class FrappeAPI:
             filter_parameter = "or_filters" if or_filters else "filters"
             params[filter_parameter] = f"[{','.join(filters)}]"
         try:
-            response = requests.get(endpoint, headers=self.headers, params=params)
+            response = self._request("GET", endpoint, headers=self.headers, params=params)
             response.raise_for_status()
             logging.debug(f"Daten erfolgreich von {endpoint} ({params}) abgerufen.")
-            return response.json()
+            return self._parse_json(response)
         except requests.exceptions.RequestException as e:
             logging.error(f"Fehler beim Abrufen der Daten von {endpoint} ({params}): {e}")
             return None
 
-    def get_all_data(self, doc_type: str, filters: list[str] = [], params: dict | None = None, or_filters=False):
-        limit_start = 0
-        data = []
-        while len(data) == limit_start:
+    def iter_all_data(
+        self,
+        doc_type: str,
+        filters: list[str] = [],
+        params: dict | None = None,
+        or_filters=False,
+        pagination: Literal["offset", "keyset"] = "offset",
+        fields: list[str] | None = None,
+    ):
+        """
+        Liefert alle Datensätze seitenweise als Generator, ohne die gesamte Liste im Speicher zu halten.
+        Mit `fields` werden nur die angegebenen Felder abgefragt (sonst alle).
+        """
+        if fields and self.config.as_list:
+            for row in self.iter_all_rows(doc_type, filters, params, or_filters, pagination, fields):
+                yield row.as_dict()
+            return
+        if fields:
+            fields = self._known_fields(doc_type, fields)
+        yield from self._iter_records(doc_type, filters, params, or_filters, pagination, fields)
+
+    def iter_all_rows(
+        self,
+        doc_type: str,
+        filters: list[str] = [],
+        params: dict | None = None,
+        or_filters=False,
+        pagination: Literal["offset", "keyset"] = "offset",
+        fields: list[str] = [],
+    ) -> Iterator[Row]:
+        """
+        Wie iter_all_data, liefert die Datensätze aber als kompakte Zeilen (utils.rows.Row) mit den Spalten `fields`.
+        Mit `as_list` überträgt Frappe die Feldnamen nicht pro Datensatz; dict-Antworten werden ebenfalls umgewandelt.
+        """
+        if not fields:
+            raise ValueError("Für den Abruf als Zeilen müssen die Felder angegeben werden.")
+        params = params.copy() if params else {}
+        params["as_dict"] = 0 if self.config.as_list else 1
+        fields = self._known_fields(doc_type, fields)
+        return self._iter_records(doc_type, filters, params, or_filters, pagination, fields)
+
+    def iter_rows_by_values(
+        self, doc_type: str, field: str, values: list, fields: list[str], filters: list[str] = []
+    ) -> Iterator[Row]:
+        """
+        Liefert alle Datensätze, deren `field` einen der `values` hat, als Zeilen mit den Spalten `fields`.
+        Die Werte werden so auf `in`-Filter verteilt, dass keine URL länger als `max_url_length` wird, und die
+        Blöcke parallel (`fetch_concurrency`) abgerufen. Passt selbst ein einzelner Wert nicht in die URL, wird der
+        Block per POST an frappe.client.get_list gesendet.
+        """
+        if not fields:
+            raise ValueError("Für den Abruf als Zeilen müssen die Felder angegeben werden.")
+        fields = self._known_fields(doc_type, fields)
+        params = {"as_dict": 0 if self.config.as_list else 1, "fields": json.dumps(fields)}
+        chunks = self._chunk_values_by_url_length(doc_type, field, list(dict.fromkeys(values)), filters, params)
+        if not chunks:
+            return
+        logging.debug(f"{len(values)} Werte für {doc_type}.{field} auf {len(chunks)} Abfrage(n) verteilt.")
+
+        def fetch(chunk: tuple[list, bool]):
+            values, post = chunk
+            chunk_filters = filters + [json.dumps([field, "in", values])]
+            pages = self._iter_offset_pages(doc_type, chunk_filters, params, or_filters=False, post=post)
+            return [row for page in pages for row in page]
+
+        if len(chunks) == 1:
+            yield from fetch(chunks[0])
+            return
+        with ThreadPoolExecutor(max_workers=min(self.config.fetch_concurrency, len(chunks))) as executor:
+            for rows in executor.map(fetch, chunks):
+                yield from rows
+
+    def _chunk_values_by_url_length(
+        self, doc_type: str, field: str, values: list, filters: list[str], params: dict
+    ) -> list[tuple[list, bool]]:
+        # Länge der URL ohne Werte abschätzen (wie von requests kodiert) und die Werte der Reihe nach auffüllen.
+        # Liefert pro Block (Werte, per POST); POST nur, wenn schon ein einzelner Wert die URL zu lang macht.
+        max_length = self.config.max_url_length
+        base_params = {
+            **params,
+            "limit_start": 10**9,
+            "limit": self.page_sizer.max_length,
+            "filters": f"[{','.join(filters + [json.dumps([field, 'in', []])])}]",
+        }
+        base_length = len(self.get_endpoint(doc_type)) + 1 + len(urlencode(base_params))
+        separator_length = len(quote_plus(", "))
+        chunks: list[tuple[list, bool]] = []
+        chunk: list = []
+        length = base_length
+        for value in values:
+            value_length = len(quote_plus(json.dumps(value)))
+            if chunk and length + separator_length + value_length > max_length:
+                chunks.append((chunk, length > max_length))
+                chunk, length = [], base_length
+            length += value_length + (separator_length if chunk else 0)
+            chunk.append(value)
+        if chunk:
+            chunks.append((chunk, length > max_length))
+        return chunks
+
+    def _iter_records(
+        self,
+        doc_type: str,
+        filters: list[str],
+        params: dict | None,
+        or_filters: bool,
+        pagination: Literal["offset", "keyset"],
+        fields: list[str] | None,
+    ):
+        if fields:
+            if pagination == "keyset":
+                fields = fields + [field for field in ("modified", "name") if field not in fields]
             params = params.copy() if params else {}
-            params["limit"] = self.config.limit_page_length
-            params["limit_start"] = limit_start
-            params["fields"] = '["*"]'
-            res = self.get_data(doc_type, filters=filters, params=params, or_filters=or_filters)
-            if res:
-                more_data = res.get("data")
-                if isinstance(more_data, list):
-                    data = data + more_data
-            limit_start = limit_start + self.config.limit_page_length
-        logging.debug(f"Insgesamt {len(data)} Datensätze gefunden.")
-        return {"data": data}
+            params["fields"] = json.dumps(fields)
+        if pagination == "keyset" and or_filters and len(filters) > 1:
+            logging.debug("Keyset-Paginierung ist mit mehreren or_filters nicht möglich, nutze limit_start.")
+            pagination = "offset"
+        if pagination == "keyset":
+            pages = self._iter_keyset_pages(doc_type, filters, params)
+        elif self.config.fetch_concurrency > 1 and not (or_filters and len(filters) > 1):
+            pages = self._iter_parallel_pages(doc_type, filters, params)
+        else:
+            pages = self._iter_offset_pages(doc_type, filters, params, or_filters)
+        count = 0
+        first_page_size = len(self.page_sizer.history)
+        for page in pages:
+            count += len(page)
+            yield from page
+        logging.debug(f"Insgesamt {count} Datensätze gefunden.")
+        page_sizes = self.page_sizer.history[first_page_size:]
+        if page_sizes:
+            logging.info(f"Seitengrößen für {doc_type}: {format_page_sizes(page_sizes)}")
+
+    def _get_page(
+        self,
+        doc_type: str,
+        filters: list[str],
+        params: dict | None,
+        page_length: int,
+        or_filters=False,
+        post=False,
+    ):
+        page_params = params.copy() if params else {}
+        page_params["limit"] = page_length
+        page_params.setdefault("fields", '["*"]')
+        started = time.monotonic()
+        if post:
+            res = self._post_list(doc_type, filters, page_params)
+        else:
+            res = self.get_data(doc_type, filters=filters, params=page_params, or_filters=or_filters)
+        page = res.get("data") if res else None
+        page = page if isinstance(page, list) else None
+        if page is not None and "as_dict" in page_params:
+            # Als Zeilen angefordert: Werte stehen in der Reihenfolge der abgefragten Felder
+            page = decode_rows(page, json.loads(page_params["fields"]))
+        self.page_sizer.record(page_length, time.monotonic() - started, page is not None)
+        return page
+
+    def _iter_offset_pages(
+        self,
+        doc_type: str,
+        filters: list[str],
+        params: dict | None,
+        or_filters: bool,
+        limit_start: int = 0,
+        post=False,
+    ):
+        while True:
+            page_length = self.page_sizer.current
+            page = self._get_offset_page(doc_type, filters, params, limit_start, page_length, or_filters, post)
+            if page is None:
+                # Bei Fehlern mit kleinerer Seite erneut versuchen
+                if page_length > self.page_sizer.min_length:
+                    continue
+                raise FrappeFetchError(f"Datensätze von {doc_type} ab {limit_start} konnten nicht abgerufen werden.")
+            yield page
+            if len(page) < page_length:
+                break
+            limit_start = limit_start + page_length
+
+    def _get_offset_page(
+        self,
+        doc_type: str,
+        filters: list[str],
+        params: dict | None,
+        limit_start: int,
+        page_length: int,
+        or_filters=False,
+        post=False,
+    ):
+        page_params = params.copy() if params else {}
+        page_params["limit_start"] = limit_start
+        return self._get_page(doc_type, filters, page_params, page_length, or_filters, post)
+
+    def _iter_parallel_pages(self, doc_type: str, filters: list[str], params: dict | None):
+        # Gesamtanzahl vorab abfragen und die Seiten parallel laden; die Reihenfolge bleibt erhalten.
+        # Die Seitengröße ist dabei fest, Antwortzeiten fließen erst in spätere Abrufe ein.
+        total = self.get_count(doc_type, filters)
+        if total is None:
+            yield from self._iter_offset_pages(doc_type, filters, params, or_filters=False)
+            return
+        page_length = self.page_sizer.current
+        concurrency = self.config.fetch_concurrency
+        limit_starts = iter(range(0, total, page_length))
+        last_page_full = False
+        next_start = 0
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+
+        def submit(limit_start: int):
+            return executor.submit(self._get_offset_page, doc_type, filters, params, limit_start, page_length)
+
+        try:
+            futures = deque()
+            for limit_start in limit_starts:
+                futures.append(submit(limit_start))
+                if len(futures) >= concurrency * 2:
+                    break
+            while futures:
+                page = futures.popleft().result()
+                if page is None:
+                    page = self._retry_offset_range(doc_type, filters, params, next_start, page_length)
+                limit_start = next(limit_starts, None)
+                if limit_start is not None:
+                    futures.append(submit(limit_start))
+                next_start = next_start + page_length
+                last_page_full = len(page) == page_length
+                yield page
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        if last_page_full:
+            # Seit der Zählung hinzugekommene Datensätze nachladen
+            yield from self._iter_offset_pages(doc_type, filters, params, or_filters=False, limit_start=next_start)
+
+    def _retry_offset_range(
+        self, doc_type: str, filters: list[str], params: dict | None, limit_start: int, length: int
+    ) -> list[dict]:
+        # Fehlgeschlagene Seite des parallelen Abrufs sequentiell mit kleineren Seiten erneut laden
+        records = []
+        end = limit_start + length
+        while limit_start < end:
+            page_length = min(self.page_sizer.current, end - limit_start)
+            page = self._get_offset_page(doc_type, filters, params, limit_start, page_length)
+            if page is None:
+                if page_length > self.page_sizer.min_length:
+                    continue
+                raise FrappeFetchError(f"Datensätze von {doc_type} ab {limit_start} konnten nicht abgerufen werden.")
+            records.extend(page)
+            if len(page) < page_length:
+                break
+            limit_start = limit_start + page_length
+        return records
+
+    def _iter_keyset_pages(self, doc_type: str, filters: list[str], params: dict | None):
+        # Sortiert nach (modified, name) und setzt nach dem zuletzt gesehenen Paar fort:
+        # modified >= m AND (modified > m OR name > n)
+        cursor: tuple[str, str] | None = None
+        while True:
+            page_params = params.copy() if params else {}
+            page_params["order_by"] = "modified asc, name asc"
+            page_filters = list(filters)
+            if cursor:
+                modified, name = cursor
+                page_filters.append(json.dumps(["modified", ">=", modified]))
+                page_params["or_filters"] = json.dumps([["modified", ">", modified], ["name", ">", name]])
+            page_length = self.page_sizer.current
+            page = self._get_page(doc_type, page_filters, page_params, page_length)
+            if page is None:
+                if page_length > self.page_sizer.min_length:
+                    continue
+                raise FrappeFetchError(f"Datensätze von {doc_type} nach {cursor} konnten nicht abgerufen werden.")
+            # Cursor vor dem Weiterreichen merken, da Aufrufer die Datensätze verändern dürfen
+            last_page = len(page) < page_length
+            if page:
+                cursor = (page[-1]["modified"], page[-1]["name"])
+            yield page
+            if last_page:
+                break
+
+    def _post_list(self, doc_type: str, filters: list[str], params: dict):
+        # Listenabfrage per POST an frappe.client.get_list, wenn die Filter nicht in die URL passen
+        endpoint = self.get_method_endpoint("frappe.client.get_list")
+        body = {
+            "doctype": doc_type,
+            "fields": json.loads(params["fields"]),
+            "filters": json.loads(f"[{','.join(filters)}]"),
+            "limit_start": params.get("limit_start", 0),
+            "limit_page_length": params["limit"],
+            "as_dict": params.get("as_dict", 1),
+        }
+        headers = self.headers.copy()
+        headers["Content-Type"] = "application/json"
+        try:
+            response = self._request("POST", endpoint, data=self.json_codec.dumps(body), headers=headers)
+            response.raise_for_status()
+            logging.debug(f"Daten erfolgreich per POST von {endpoint} ({doc_type}) abgerufen.")
+            return {"data": self._parse_json(response).get("message")}
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Fehler beim Abrufen der Daten per POST von {endpoint} ({doc_type}): {e}")
+            return None
+
+    def get_all_data(
+        self,
+        doc_type: str,
+        filters: list[str] = [],
+        params: dict | None = None,
+        or_filters=False,
+        pagination: Literal["offset", "keyset"] = "offset",
+        fields: list[str] | None = None,
+    ):
+        return {"data": list(self.iter_all_data(doc_type, filters, params, or_filters, pagination, fields))}
+
+    def get_count(self, doc_type: str, filters: list[str] = []):
+        endpoint = self.get_method_endpoint("frappe.client.get_count")
+        params = {"doctype": doc_type}
+        if len(filters) > 0:
+            params["filters"] = f"[{','.join(filters)}]"
+        try:
+            response = self._request("GET", endpoint, headers=self.headers, params=params)
+            response.raise_for_status()
+            return int(self._parse_json(response).get("message"))
+        except (requests.exceptions.RequestException, TypeError, ValueError) as e:
+            logging.error(f"Fehler beim Zählen der Datensätze von {doc_type} ({params}): {e}")
+            return None
 
     def delete(self, doc_type: str, doc_name: str):
         endpoint = self.get_endpoint(doc_type, doc_name)
@@ -107,31 +620,191 @@ class FrappeAPI:
             logging.info(f"""DRY_RUN: DELETE {endpoint}""")
             return {"message": "ok"}
         try:
-            response = requests.delete(endpoint, headers=self.headers)
+            response = self._request("DELETE", endpoint, headers=self.headers)
             response.raise_for_status()
             logging.debug(f"{doc_name} erfolgreich gelöscht. ({endpoint})")
-            return response.json()
+            return self._parse_json(response)
         except requests.exceptions.RequestException as e:
             logging.error(f"Fehler beim Löschen von {doc_name} ({endpoint}): {e}")
             return None
 
+    def get_method_endpoint(self, method: str):
+        return f"{self.config.url}/api/method/{method}"
+
     def get_endpoint(self, doc_type: str, doc_name: str | None = None):
         endpoint = f"{self.config.url}/api/resource/{doc_type}"
         if doc_name:
             endpoint = endpoint + f"/{doc_name}"
         return endpoint
 
-    def get_time_zone(self):
-        system_settings = self.get_data("System Settings", "System Settings").get("data")
+    @property
+    def tz_delta(self):
+        # Aus dem einmal gelesenen Zeitzonennamen berechnet, damit eine Sommer-/Winterzeit-Umstellung greift
+        if self.time_zone_name:
+            return datetime.now(ZoneInfo(self.time_zone_name)).utcoffset()
+
+    def get_time_zone_name(self):
+        return self._get_metadata("time_zone", self._fetch_time_zone_name)
+
+    def _fetch_time_zone_name(self):
+        res = self.get_data("System Settings", "System Settings")
+        system_settings = res.get("data") if res else None
         if system_settings:
-            tz_str = system_settings["time_zone"]
-            return datetime.now(ZoneInfo(tz_str)).utcoffset()
+            return system_settings["time_zone"]
+
+    def get_doctype_fields(self, doc_type: str) -> dict[str, str] | None:
+        """
+        Feldnamen und -typen des DocType (inkl. Custom Fields), ohne Standardfelder wie name oder modified.
+        """
+        return self._get_metadata(f"doctype:{doc_type}", lambda: self._fetch_doctype_fields(doc_type))
+
+    def _fetch_doctype_fields(self, doc_type: str):
+        endpoint = self.get_method_endpoint("frappe.desk.form.load.getdoctype")
+        try:
+            response = self._request("GET", endpoint, headers=self.headers, params={"doctype": doc_type})
+            response.raise_for_status()
+            docs = self._parse_json(response).get("docs") or []
+        except requests.exceptions.RequestException as e:
+            logging.warning(f"Metadaten von {doc_type} konnten nicht abgerufen werden: {e}")
+            return None
+        for doc in docs:
+            if doc.get("name") == doc_type:
+                return {
+                    field["fieldname"]: field["fieldtype"] for field in doc.get("fields", []) if field.get("fieldname")
+                }
+        return None
+
+    def _get_metadata(self, name: str, fetch):
+        # Schlüssel enthält die URL, damit mehrere Frappe-Instanzen dieselbe History-DB nutzen können
+        key = f"{self.config.url}|{name}"
+        ttl = self.config.meta_cache_ttl_seconds
+        if self.metadata_cache and ttl > 0:
+            value = self.metadata_cache.get_metadata(key, ttl)
+            if value is not None:
+                return value
+        value = fetch()
+        if value is not None and self.metadata_cache and ttl > 0:
+            self.metadata_cache.save_metadata(key, value)
+        return value
+
+    def _known_fields(self, doc_type: str, fields: list[str]):
+        # Felder, die der DocType nicht (mehr) hat, lässt Frappe die ganze Abfrage ablehnen.
+        # Geprüft wird nur mit Metadaten-Cache, sonst kostete jeder Abruf einen zusätzlichen Request.
+        if not self.metadata_cache or self.config.meta_cache_ttl_seconds <= 0:
+            return fields
+        doctype_fields = self.get_doctype_fields(doc_type)
+        if not doctype_fields:
+            return fields
+        unknown = [
+            field
+            for field in fields
+            if field not in doctype_fields and field not in STANDARD_FIELDS and field.isidentifier()
+        ]
+        if unknown:
+            logging.warning(f"Felder {unknown} existieren in {doc_type} nicht und werden nicht abgefragt.")
+            return [field for field in fields if field not in unknown]
+        return fields
+
+
+class RateLimiter:
+    """
+    Token-Bucket für Requests an Frappe: höchstens `rate` Requests pro Sekunde mit Bursts bis `burst`.
+    Ohne `rate` wird nur bei 429-Antworten (pause) gewartet. Die gesamte Wartezeit steht in `wait_seconds`.
+    """
+
+    def __init__(self, rate: float | None, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.rate is None:
+                        return
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                self.wait_seconds += wait
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+def parse_retry_after(value: str | None):
+    # Retry-After enthält entweder Sekunden oder ein HTTP-Datum
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0)
+
+
+class PageSizer:
+    """
+    Passt die Seitengröße für Listenabfragen an die beobachteten Antwortzeiten an: Sie wächst, solange Antworten
+    deutlich unter der Zielzeit bleiben, und halbiert sich bei langsamen Antworten oder Fehlern.
+    """
+
+    def __init__(self, config: FrappeConfig):
+        self.min_length = min(config.min_page_length, config.limit_page_length)
+        self.max_length = max(config.max_page_length, self.min_length)
+        self.target_seconds = config.page_target_latency_seconds
+        self.current = min(max(config.limit_page_length, self.min_length), self.max_length)
+        self.history: list[int] = []
+        self._lock = threading.Lock()
+
+    def record(self, page_length: int, seconds: float, success: bool):
+        with self._lock:
+            self.history.append(page_length)
+            if not success or seconds > self.target_seconds:
+                self.current = max(self.min_length, page_length // 2)
+            elif seconds < self.target_seconds / 2:
+                # Doppelte Seitengröße braucht etwa doppelt so lange und bleibt so unter der Zielzeit
+                self.current = min(self.max_length, page_length * 2)
+
+
+def format_page_sizes(page_sizes: list[int]):
+    # Aufeinanderfolgende gleiche Werte zusammenfassen, z. B. "20, 40, 80 x12"
+    groups: list[list[int]] = []
+    for size in page_sizes:
+        if groups and groups[-1][0] == size:
+            groups[-1][1] += 1
+        else:
+            groups.append([size, 1])
+    return ", ".join(f"{size} x{count}" if count > 1 else str(size) for size, count in groups)
+
+
+def remove_readonly_fields(data: dict):
+    # To old modified date leads to 413 frappe.exceptions.TimestampMismatchError and frappe overrides it anyway
+    if "modified" in data:
+        data.pop("modified")
+    # sending creation date leads to 417 frappe.exceptions.CannotChangeConstantError and frappe overrides it anyway
+    if "creation" in data:
+        data.pop("creation")
+    return data
 
 
-class CustomEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, (datetime, date)):
-            return obj.isoformat()
-        elif isinstance(obj, Decimal):
-            return float(obj)  # or str(obj) if you prefer
-        return super(CustomEncoder, self).default(obj)
+def chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
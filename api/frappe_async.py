@@ -0,0 +1,85 @@
+import asyncio
+from typing import Literal
+
+from api.frappe import INSERT_MANY_LIMIT, FrappeAPI, chunks
+
+
+class AsyncFrappeAPI:
+    """
+    Asynchrone Variante von FrappeAPI mit derselben Methoden-Oberfläche.
+    Die Requests laufen über die Session der übergebenen FrappeAPI in Worker-Threads, begrenzt durch
+    `write_concurrency`. Schreibzugriffe auf dasselbe Dokument werden in Aufrufreihenfolge ausgeführt.
+    Asyncio-Primitive sind an eine Event-Loop gebunden, daher pro Loop eine eigene Instanz erzeugen.
+    """
+
+    def __init__(self, frappe_api: FrappeAPI):
+        self.api = frappe_api
+        self.config = frappe_api.config
+        self.dry_run = frappe_api.dry_run
+        # Im Dry-Run wird nur geloggt: sequentiell, damit die Ausgabe der synchronen Variante entspricht
+        concurrency = 1 if frappe_api.dry_run else frappe_api.config.write_concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._doc_locks: dict[tuple[str, str], asyncio.Lock] = {}
+
+    async def _run(self, fn, *args):
+        async with self._semaphore:
+            return await asyncio.to_thread(fn, *args)
+
+    async def _run_for_doc(self, doc_type: str, doc_name: str, fn, *args):
+        # Die Sperre pro Dokument wird vor dem Semaphor angefordert; asyncio.Lock ist FIFO, die Reihenfolge bleibt
+        lock = self._doc_locks.setdefault((doc_type, doc_name), asyncio.Lock())
+        async with lock:
+            return await self._run(fn, *args)
+
+    async def get_data(
+        self,
+        doc_type: str,
+        doc_name: str | None = None,
+        filters: list[str] = [],
+        params: dict | None = None,
+        or_filters=False,
+    ):
+        return await self._run(self.api.get_data, doc_type, doc_name, filters, params, or_filters)
+
+    async def get_all_data(
+        self,
+        doc_type: str,
+        filters: list[str] = [],
+        params: dict | None = None,
+        or_filters=False,
+        pagination: Literal["offset", "keyset"] = "offset",
+        fields: list[str] | None = None,
+    ):
+        return await self._run(self.api.get_all_data, doc_type, filters, params, or_filters, pagination, fields)
+
+    async def insert_data(self, doc_type: str, data: dict):
+        return await self._run(self.api.insert_data, doc_type, data)
+
+    async def update_data(self, doc_type: str, doc_name: str, data: dict):
+        return await self._run_for_doc(doc_type, doc_name, self.api.update_data, doc_type, doc_name, data)
+
+    async def delete(self, doc_type: str, doc_name: str):
+        return await self._run_for_doc(doc_type, doc_name, self.api.delete, doc_type, doc_name)
+
+    async def insert_many(self, doc_type: str, docs: list[dict], key_fields: list[str] | None = None, key_fn=None):
+        size = min(self.config.write_batch_size, INSERT_MANY_LIMIT)
+        results = await asyncio.gather(
+            *(self._run(self.api.insert_many, doc_type, chunk, key_fields, key_fn) for chunk in chunks(docs, size))
+        )
+        return [res for chunk_results in results for res in chunk_results]
+
+    async def update_many(self, doc_type: str, updates: list[tuple[str, dict]]):
+        doc_names = [doc_name for doc_name, _ in updates]
+        if len(set(doc_names)) < len(doc_names):
+            # Mehrere Updates für dasselbe Dokument: Reihenfolge nur bei sequentieller Ausführung garantiert
+            return await self._run(self.api.update_many, doc_type, updates)
+        results = await asyncio.gather(
+            *(
+                self._run(self.api.update_many, doc_type, chunk)
+                for chunk in chunks(updates, self.config.write_batch_size)
+            )
+        )
+        return [res for chunk_results in results for res in chunk_results]
+
+    async def delete_many(self, doc_type: str, doc_names: list[str]):
+        return list(await asyncio.gather(*(self.delete(doc_type, doc_name) for doc_name in doc_names)))
@@ -0,0 +1,77 @@
+from datetime import date, datetime
+from decimal import Decimal
+import json
+import logging
+from typing import Literal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class CustomEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, (datetime, date)):
+            return obj.isoformat()
+        elif isinstance(obj, Decimal):
+            return float(obj)  # or str(obj) if you prefer
+        return super(CustomEncoder, self).default(obj)
+
+
+def encode_default(obj):
+    # Dieselbe Umwandlung wie CustomEncoder, für Codecs mit default-Funktion
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    elif isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class StdlibJsonCodec:
+    """
+    JSON über das Modul json der Standardbibliothek (ASCII-Ausgabe wie bisher).
+    """
+
+    name = "stdlib"
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(obj, cls=CustomEncoder).encode("ascii")
+
+    def loads(self, data: bytes | str):
+        return json.loads(data)
+
+
+class OrjsonJsonCodec:
+    """
+    JSON über orjson (nativ, UTF-8). Datumswerte serialisiert orjson selbst im selben Format wie isoformat(),
+    Decimal läuft wie bei CustomEncoder über float.
+    """
+
+    name = "orjson"
+
+    def __init__(self):
+        # Nicht-String-Schlüssel wie die Standardbibliothek in Strings umwandeln
+        self.options = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj) -> bytes:
+        return orjson.dumps(obj, default=encode_default, option=self.options)
+
+    def loads(self, data: bytes | str):
+        return orjson.loads(data)
+
+
+JsonCodec = StdlibJsonCodec | OrjsonJsonCodec
+
+
+def get_json_codec(name: Literal["auto", "orjson", "stdlib"] = "auto") -> JsonCodec:
+    """
+    Liefert den JSON-Codec: `auto` nutzt orjson, falls installiert, sonst die Standardbibliothek.
+    """
+    if name == "stdlib":
+        return StdlibJsonCodec()
+    if orjson is None:
+        if name == "orjson":
+            logging.warning("orjson ist nicht installiert, nutze die JSON-Standardbibliothek.")
+        return StdlibJsonCodec()
+    return OrjsonJsonCodec()
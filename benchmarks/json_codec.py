@@ -0,0 +1,68 @@
+"""
+Micro-Benchmark der JSON-Codecs für typische Frappe-Payloads:
+Sammel-Insert (Encode) und Listenseite (Decode, als dicts und kompakt als Wertelisten).
+
+    python -m benchmarks.json_codec [--records 1000] [--repeat 20]
+"""
+
+import argparse
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+import timeit
+
+from api.json_codec import OrjsonJsonCodec, StdlibJsonCodec, orjson
+
+
+def make_docs(count: int):
+    start = datetime(2024, 1, 1, 8, 0)
+    return [
+        {
+            "doctype": "Contact",
+            "first_name": f"Vorname {i}",
+            "last_name": "Müller",
+            "email_id": f"kontakt{i}@example.com",
+            "phone": f"+49 30 {i:07}",
+            "company_name": "Beispiel GmbH & Co. KG",
+            "status": "Open" if i % 3 else "Passive",
+            "credit_limit": Decimal(f"{i}.50"),
+            "birthday": date(1980, 1, 1) + timedelta(days=i),
+            "custom_optigem_id": i,
+            "modified": start + timedelta(minutes=i, microseconds=i),
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    codecs = [StdlibJsonCodec()]
+    if orjson is not None:
+        codecs.append(OrjsonJsonCodec())
+    else:
+        print("orjson ist nicht installiert, es wird nur die Standardbibliothek gemessen.")
+
+    docs = make_docs(args.records)
+    stdlib = StdlibJsonCodec()
+    page = stdlib.loads(stdlib.dumps({"data": docs}))
+    fields = list(page["data"][0].keys())
+    list_page = stdlib.dumps({"data": [[rec[field] for field in fields] for rec in page["data"]]})
+    dict_page = stdlib.dumps(page)
+
+    print(f"{args.records} Datensätze, {args.repeat} Wiederholungen (ms pro Durchlauf)")
+    print(f"{'Codec':<8} {'Encode':>10} {'Decode dict':>12} {'Decode list':>12}")
+    for codec in codecs:
+        encode = timeit.timeit(lambda: codec.dumps({"docs": docs}), number=args.repeat)
+        decode_dict = timeit.timeit(lambda: codec.loads(dict_page), number=args.repeat)
+        decode_list = timeit.timeit(lambda: codec.loads(list_page), number=args.repeat)
+        print(
+            f"{codec.name:<8} {encode / args.repeat * 1000:>10.2f} {decode_dict / args.repeat * 1000:>12.2f}"
+            f" {decode_list / args.repeat * 1000:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
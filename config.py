@@ -6,12 +6,16 @@ class DatabaseBase(BaseModel):
     database: str
     user: str
     password: str
+    # Im Service bleiben Verbindungen zwischen den Runs offen, höchstens so lange ungenutzt (0 = nach jedem Run schließen)
+    pool_max_idle_seconds: int = Field(default=600, ge=0)
 
 
 class MssqlDatabaseConfig(DatabaseBase):
     type: Literal["mssql"]
     server: str
     trust_server_certificate: bool = False
+    # Sammelschreibvorgänge per pyodbc fast_executemany (alle Parametersätze in einem Roundtrip)
+    fast_executemany: bool = True
 
 
 class FirebirdDatabaseConfig(DatabaseBase):
@@ -30,8 +34,35 @@ class FrappeAuthConfig(BaseModel):
 
 
 class FrappeConfig(FrappeAuthConfig):
-    limit_page_length: int = 20
+    limit_page_length: int = 20  # Startwert, wird anhand der Antwortzeiten angepasst
     url: str  # without trailing slash
+    # Grenzen und Zielantwortzeit für die adaptive Seitengröße (min = max deaktiviert die Anpassung)
+    min_page_length: int = Field(default=20, ge=1)
+    max_page_length: int = Field(default=1000, ge=1)
+    page_target_latency_seconds: float = Field(default=2, gt=0)
+    # Verbindungspool (HTTP Keep-Alive) und Wiederholungen bei 429/502/503/504 (429 auch für POST)
+    pool_size: int = Field(default=10, ge=1)
+    connect_timeout_seconds: float = Field(default=10, gt=0)
+    read_timeout_seconds: float = Field(default=120, gt=0)
+    max_retries: int = Field(default=3, ge=0)
+    retry_backoff_factor: float = Field(default=0.5, ge=0)
+    # Anzahl paralleler Seitenabrufe bei nicht-inkrementellen Abrufen (1 = sequentiell)
+    fetch_concurrency: int = Field(default=4, ge=1)
+    # Anzahl Dokumente pro Sammel-Request beim Einfügen, Aktualisieren und Löschen
+    write_batch_size: int = Field(default=100, ge=1)
+    # Anzahl gleichzeitiger Schreib-Requests
+    write_concurrency: int = Field(default=4, ge=1)
+    # Client-seitiges Ratenlimit (Token-Bucket); ohne Angabe wird nur bei 429-Antworten gewartet
+    rate_limit_per_second: Optional[float] = Field(default=None, gt=0)
+    rate_limit_burst: int = Field(default=10, ge=1)
+    # Listen kompakt abrufen (as_dict=0): Feldnamen nur einmal pro Abfrage, Datensätze als Wertelisten
+    as_list: bool = True
+    # Maximale URL-Länge für GET-Abfragen; längere Listen von Ids werden auf mehrere Abfragen verteilt
+    max_url_length: int = Field(default=4000, ge=500)
+    # Gültigkeit der zwischengespeicherten Metadaten (Zeitzone, DocType-Felder) in Sekunden, 0 = kein Cache
+    meta_cache_ttl_seconds: int = Field(default=86400, ge=0)
+    # JSON-Bibliothek für Requests und Antworten (auto = orjson, falls installiert)
+    json_codec: Literal["auto", "orjson", "stdlib"] = "auto"
 
 
 class TaskFrappeBase(BaseModel):
@@ -41,6 +72,8 @@ class TaskFrappeBase(BaseModel):
     datetime_fields: list[str] = []
     # All fields that will get parsed to int (due to frappe int fields have default 0, so int are sometimes stored in 'Data' Fields (string))
     int_fields: list[str] = []
+    # Paginierung der Listenabfragen; ohne Angabe wird bei inkrementellen Abrufen "keyset" genutzt, sonst "offset"
+    pagination: Optional[Literal["offset", "keyset"]] = None
 
     def model_post_init(self, __context):
         for modified_field in self.modified_fields:
@@ -54,12 +87,21 @@ class TaskFrappeBidirectional(TaskFrappeBase):
 
 class TaskDbBase(BaseModel):
     modified_fields: list[str]
+    # Anzahl Datensätze pro Sammelabfrage (z. B. Existenzprüfung der Schlüssel) und Sammelschreibvorgang
+    batch_size: int = Field(default=500, ge=1)
+    # Commit nach jeder Anweisung bzw. jedem Sammelschreibvorgang ("statement"), alle commit_every Datensätze
+    # ("batch") oder einmal am Ende des Task-Runs ("run")
+    commit_policy: Literal["statement", "batch", "run"] = "statement"
+    commit_every: int = Field(default=1000, ge=1)
 
 
 class TaskDbFrappeToDb(TaskDbBase):
     manual_id_sequence: bool = False
     manual_id_sequence_max: Optional[int] = None
     id_field: str
+    # Eingefügte Zeilen per OUTPUT (MSSQL) bzw. RETURNING (Firebird) zurückgeben statt erneut abzufragen; lehnt die
+    # Tabelle das ab (MSSQL-Tabelle mit Triggern), wird für den Run auf erneutes Abfragen umgeschaltet
+    returning: bool = True
 
 
 class TaskDbBidirectional(TaskDbFrappeToDb):
@@ -131,6 +173,14 @@ class FrappeToDbTaskConfig(TaskBase):
     direction: Literal["frappe_to_db"]
     table_name: str
     db: TaskDbFrappeToDb
+    # Schreiben per einzelnen INSERT/UPDATE ("statements") oder mengenbasiert per MERGE bzw. UPDATE OR INSERT ("merge")
+    upsert: Literal["statements", "merge"] = "statements"
+
+    @model_validator(mode="after")
+    def check_upsert(self) -> "FrappeToDbTaskConfig":
+        if self.upsert == "merge" and self.db.manual_id_sequence:
+            raise ValueError("'upsert: merge' kann nicht zusammen mit 'manual_id_sequence' genutzt werden.")
+        return self
 
 
 TaskConfig = Annotated[
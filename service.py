@@ -13,6 +13,7 @@ from fastapi.responses import FileResponse
 from pydantic import BaseModel
 import uvicorn
 
+from api.database import ConnectionPool
 from sync.manager import SyncManager, resolve_timestamp_path
 from utils.config_loader import load_config_file
 from utils.history_db import TaskHistoryDB
@@ -31,6 +32,8 @@ class SyncService:
         self._stop_event = threading.Event()
         self._wake_event = threading.Event()
         self._scheduler_thread: threading.Thread | None = None
+        # Datenbankverbindungen bleiben zwischen den Runs offen
+        self.connection_pool = ConnectionPool()
 
         self._reload_config()
 
@@ -91,6 +94,7 @@ class SyncService:
         self._wake_event.set()
         if self._scheduler_thread and self._scheduler_thread.is_alive():
             self._scheduler_thread.join(timeout=2)
+        self.connection_pool.close_all()
 
     def set_cron(self, cron_expr: str):
         expr = cron_expr.strip()
@@ -136,7 +140,7 @@ class SyncService:
             selection = f" (Tasks: {', '.join(task_names)})" if task_names else ""
             logging.info("Starte Sync (%s)%s", reason, selection)
             self._reload_config()
-            manager = SyncManager(self.config, self.config_path)
+            manager = SyncManager(self.config, self.config_path, connection_pool=self.connection_pool)
             manager.run(task_names=task_names)
             # Plan evtl. neu laden (falls z. B. DB erneuert wurde)
             self._load_schedule_from_db()
@@ -275,6 +279,13 @@ def create_app(service: SyncService) -> FastAPI:
             logs = history_db.get_run_logs(run_id, limit=limit)
         return {"run": run, "logs": logs}
 
+    @app.delete("/metadata-cache")
+    async def clear_metadata_cache():
+        # Nach Änderungen an DocTypes oder der Zeitzone in Frappe, sonst gilt meta_cache_ttl_seconds
+        with TaskHistoryDB(service.history_db_path) as history_db:
+            deleted = history_db.clear_metadata()
+        return {"deleted": deleted}
+
     return app
 
 
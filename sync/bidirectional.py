@@ -8,8 +8,8 @@ from sync.task import SyncTaskBase
 
 class BidirectionalSyncTask(SyncTaskBase[BidirectionalTaskConfig]):
     def sync(self, last_sync_date_utc: datetime | None = None):
-        frappe_dict = self.get_frappe_key_record_dict(self.get_frappe_records(last_sync_date_utc))
-        db_dict = self.get_db_key_record_dict(self.get_db_records(last_sync_date_utc))
+        frappe_dict = self.get_frappe_key_record_dict(self.iter_frappe_records(last_sync_date_utc))
+        db_dict = self.get_db_key_record_dict(self.iter_db_records(last_sync_date_utc))
 
         # check for same types in key
         if len(frappe_dict) > 0 and len(db_dict) > 0:
@@ -42,6 +42,8 @@ class BidirectionalSyncTask(SyncTaskBase[BidirectionalTaskConfig]):
         # Alle vorhandenen Schlüssel zusammenführen
         all_keys = set(frappe_dict.keys()).union(db_dict.keys())
 
+        # Neue Frappe-Datensätze gesammelt einfügen (ein Id-Block bei manueller Id-Sequenz)
+        db_inserts: list[dict] = []
         for key in all_keys:
             frappe_rec = frappe_dict.get(key)
             db_rec = db_dict.get(key)
@@ -60,7 +62,7 @@ class BidirectionalSyncTask(SyncTaskBase[BidirectionalTaskConfig]):
                     self.update_db_record(frappe_rec)
                 elif frappe_newer < 0:
                     logging.info(f"Konflikt für Schlüssel {key}: DB ist aktueller. Aktualisiere Frappe.")
-                    self.update_frappe_record(db_rec, frappe_rec[self.config.frappe.id_field])
+                    self.queue_frappe_update(db_rec, frappe_rec[self.config.frappe.id_field])
                 else:
                     logging.info(f"Datensatz {key} ist synchronisiert.")
 
@@ -71,9 +73,7 @@ class BidirectionalSyncTask(SyncTaskBase[BidirectionalTaskConfig]):
                     self.delete_frappe_record(frappe_rec)
                 else:
                     logging.info(f"Neuer Frappe-Datensatz {key} gefunden. Einfügen in die DB.")
-                    created_db_rec = self.insert_frappe_record_to_db(frappe_rec)
-                    if created_db_rec and created_db_rec.get(self.config.db.id_field):
-                        self.update_frappe_foreign_id(frappe_rec, created_db_rec[self.config.db.id_field])
+                    db_inserts.append(frappe_rec)
 
             elif db_rec and not frappe_rec:
                 # Der Datensatz existiert in der DB, aber nicht in Frappe.
@@ -82,9 +82,17 @@ class BidirectionalSyncTask(SyncTaskBase[BidirectionalTaskConfig]):
                     self.delete_db_record(db_rec)
                 else:
                     logging.info(f"Neuer DB-Datensatz {key} gefunden. Einfügen in Frappe.")
-                    created_frappe_doc = self.insert_db_record_to_frappe(db_rec)
-                    if created_frappe_doc and created_frappe_doc.get(self.config.frappe.id_field):
-                        self.update_db_foreign_id(db_rec, created_frappe_doc[self.config.frappe.id_field])
+                    self.queue_frappe_insert(db_rec)
+        for frappe_rec, created_db_rec in zip(db_inserts, self.insert_frappe_records_to_db(db_inserts)):
+            if created_db_rec and created_db_rec.get(self.config.db.id_field):
+                self.update_frappe_foreign_id(frappe_rec, created_db_rec[self.config.db.id_field])
+        self.flush_frappe_writes()
+        # Nach den Frappe-Inserts, deren neue Ids noch in die DB geschrieben werden
+        self.flush_db_writes()
+
+    def on_frappe_record_inserted(self, db_rec: dict, frappe_doc: dict):
+        if frappe_doc.get(self.config.frappe.id_field):
+            self.update_db_foreign_id(db_rec, frappe_doc[self.config.frappe.id_field])
 
     def get_modified_timestamp(self, record: dict, source: Literal["frappe", "db"]) -> datetime | None:
         timestamp = None
@@ -107,27 +115,23 @@ class BidirectionalSyncTask(SyncTaskBase[BidirectionalTaskConfig]):
         where_clause = f"{self.esc_db_col(self.config.db.id_field)} = ?"
         sql = f"UPDATE {self.config.table_name} SET {set_clause} WHERE {where_clause}"
         params = [foreign_id, db_rec.get(self.config.db.id_field)]
-        self.execute_query(sql, params, f"DB-Datensatz wurde aktualisiert.")
+        self.queue_db_write(sql, params, "DB-Datensatz wurde aktualisiert.", key=("id", params[1]))
 
     def update_frappe_foreign_id(self, frappe_rec: dict, foreign_id: str):
         data = {}
         data[self.config.frappe.fk_id_field] = foreign_id
-        res = self.frappe_api.update_data(self.config.doc_type, frappe_rec.get(self.config.frappe.id_field), data)
-        if res:
-            return res.get("data")
+        self.queue_frappe_data_update(frappe_rec.get(self.config.frappe.id_field), data)
 
     def delete_frappe_record(self, frappe_rec: dict):
         if self.config.delete:
-            self.frappe_api.delete(self.config.doc_type, frappe_rec[self.config.frappe.id_field])
+            self.queue_frappe_delete(frappe_rec[self.config.frappe.id_field])
 
     def delete_db_record(self, db_rec: dict):
         if self.config.delete:
             sql = f"DELETE FROM {self.config.table_name} WHERE {self.esc_db_col(self.config.db.id_field)} = ?"
-            self.execute_query(
-                sql,
-                [db_rec[self.config.db.id_field]],
-                f"DB-Datensatz {db_rec[self.config.db.id_field]} wurde gelöscht.",
-            )
+            db_id = db_rec[self.config.db.id_field]
+            logging.debug(f"DB-Datensatz {db_id} wird gelöscht.")
+            self.queue_db_write(sql, [db_id], "DB-Datensatz wurde gelöscht.", key=("id", db_id))
 
     def compare_key_tuple_structure(self, frappe_key: tuple, db_key: tuple) -> bool:
         if len(frappe_key) != len(db_key):
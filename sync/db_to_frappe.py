@@ -2,30 +2,96 @@ from datetime import datetime
 import logging
 
 from config import DbToFrappeTaskConfig
-from sync.task import SyncTaskBase
+from sync.task import SyncTaskBase, normalize_key_value
 
 
 class DbToFrappeSyncTask(SyncTaskBase[DbToFrappeTaskConfig]):
     def sync(self, last_sync_date_utc: datetime | None = None):
-        db_records = self.get_db_records(last_sync_date_utc)
+        # DB-Datensätze in Blöcken von db.batch_size verarbeiten, ohne sie vorab vollständig zu laden
+        self._frappe_names: dict[tuple, list[str]] = {}
+        self._frappe_index_complete = False
+        self._frappe_count: int | None = None
+        block: list = []
+        for record in self.iter_db_records(last_sync_date_utc):
+            block.append(record)
+            if len(block) >= self._db_batch_size():
+                self.sync_block(block)
+                block = []
+        if block:
+            self.sync_block(block)
 
-        for record in db_records:
-            data = self.map_db_to_frappe(record)
-            filters = self.get_filters_from_data(data)
+    def sync_block(self, db_records: list):
+        # Nur die Schlüsselfelder vorab übersetzen; vollständig gemappt wird erst beim Senden an Frappe
+        key_records = [self.map_db_keys_to_frappe(record) for record in db_records]
+        if not self._frappe_index_complete:
+            # Vorhandene Dokumente gesammelt nachschlagen statt einer Abfrage pro Datensatz
+            self._frappe_names.update(self.get_frappe_name_index(key_records))
+        # Schlüssel vorgemerkter Inserts, damit doppelte Schlüssel in der DB nicht doppelt angelegt werden
+        pending_insert_keys: set[tuple] = set()
+
+        for record, key_data in zip(db_records, key_records):
+            key = self.get_index_key(key_data)
+            filters = None
+            if key is None:
+                # Unvollständiger Schlüssel: wie bisher mit den vorhandenen Schlüsselfeldern einzeln suchen
+                filters = self.get_filters_from_data(key_data)
+                if not filters:
+                    self.queue_frappe_insert(record)
+                    continue
+                key = tuple(filters)
+            if key in pending_insert_keys:
+                self.flush_frappe_inserts()
+                pending_insert_keys.clear()
             if filters:
-                # Suche nach existierendem Dokument
                 existing_docs = self.frappe_api.get_data(self.config.doc_type, filters=filters)
-                if existing_docs and existing_docs.get("data"):
-                    # Dokument(e) existieren
-                    if self.config.process_all:
-                        for doc in existing_docs["data"]:
-                            self.update_frappe_record(record, doc["name"])
-                    else:
-                        self.update_frappe_record(record, existing_docs["data"][0]["name"])
-                else:
-                    self.insert_db_record_to_frappe(record)
+                names = [doc["name"] for doc in existing_docs.get("data") or []] if existing_docs else []
+            else:
+                names = self._frappe_names.get(key, [])
+            if names:
+                # Dokument(e) existieren
+                for name in names if self.config.process_all else names[:1]:
+                    self.queue_frappe_update(record, name)
             else:
-                self.insert_db_record_to_frappe(record)
+                pending_insert_keys.add(key)
+                self.queue_frappe_insert(record)
+        self.flush_frappe_writes()
+
+    def on_frappe_record_inserted(self, db_rec: dict, frappe_doc: dict):
+        key = self.get_index_key(self.map_db_keys_to_frappe(db_rec))
+        if key is not None and frappe_doc.get("name"):
+            self._frappe_names.setdefault(key, []).append(frappe_doc["name"])
+
+    def get_frappe_name_index(self, frappe_records: list[dict]) -> dict[tuple, list[str]]:
+        """
+        Ordnet den Schlüsseln der DB-Datensätze (übersetzte Schlüsselfelder) die Namen der vorhandenen
+        Frappe-Dokumente zu.
+        Gesucht wird über `in`-Filter auf das erste Schlüsselfeld; umfasst der DocType kaum mehr Dokumente als
+        gesucht werden, werden stattdessen nur Name und Schlüsselfelder aller Dokumente gelesen. Dieser vollständige
+        Index gilt dann auch für die folgenden Blöcke.
+        """
+        keys = {self.get_index_key(data) for data in frappe_records} - {None}
+        if not keys:
+            return {}
+        key_fields = list(self.config.key_fields)
+        fields = list(dict.fromkeys(["name"] + key_fields))
+        if self._frappe_count is None:
+            self._frappe_count = self.frappe_api.get_count(self.config.doc_type)
+        total = self._frappe_count
+        complete = total is not None and total <= 2 * len(keys)
+        if complete:
+            rows = self.frappe_api.iter_all_rows(self.config.doc_type, fields=fields)
+        else:
+            # Werte wie bisher im Filter als String übergeben
+            values = [str(data[key_fields[0]]) for data in frappe_records if self.get_index_key(data) is not None]
+            rows = self.frappe_api.iter_rows_by_values(self.config.doc_type, key_fields[0], values, fields)
+        index: dict[tuple, list[str]] = {}
+        for row in rows:
+            key = tuple(normalize_key_value(row.get(key_field)) for key_field in key_fields)
+            if complete or key in keys:
+                index.setdefault(key, []).append(row["name"])
+        logging.info(f"{len(keys & index.keys())} von {len(keys)} Schlüsseln in {self.config.doc_type} gefunden.")
+        self._frappe_index_complete = complete
+        return index
 
     def get_filters_from_data(self, data: dict):
         filters: list[str] = []
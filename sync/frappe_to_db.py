@@ -3,32 +3,168 @@ import logging
 from api.database import format_query
 from config import FrappeToDbTaskConfig
 from sync.task import SyncTaskBase
+from utils.rows import Row, row_type
+
+# Sitzungsgebundene temporäre Tabelle für MERGE auf MSSQL
+MSSQL_STAGING_TABLE = "#frappe_staging"
 
 
 class FrappeToDbSyncTask(SyncTaskBase[FrappeToDbTaskConfig]):
     def sync(self, last_sync_date_utc: datetime | None = None):
-        # Daten von Frappe abrufen
-        frappe_records = self.get_frappe_records(last_sync_date_utc)
+        # Daten von Frappe seitenweise abrufen und blockweise verarbeiten
+        batch: list[dict] = []
+        for frappe_rec in self.iter_frappe_records(last_sync_date_utc):
+            batch.append(frappe_rec)
+            if len(batch) >= self._db_batch_size():
+                self.sync_batch(batch)
+                batch = []
+        if batch:
+            self.sync_batch(batch)
+
+    def sync_batch(self, frappe_records: list[dict]):
+        """
+        Prüft die Existenz aller Datensätze des Blocks mit einer Abfrage und teilt ihn in Inserts und Updates auf.
+        """
+        if self.config.upsert == "merge" and self.config.create_new:
+            _, frappe_records = self.merge_db_records(frappe_records)
+            if not frappe_records:
+                return
+        db_keys = [
+            self.map_frappe_to_db(self.split_frappe_in_data_and_keys(rec)[1], warns=False) for rec in frappe_records
+        ]
+        existing = self.get_existing_db_keys(db_keys)
+
+        inserts: list[dict] = []
+        updates: list[dict] = []
+        for frappe_rec, keys in zip(frappe_records, db_keys):
+            key = self.get_db_key_tuple(keys)
+            if key is None:
+                # Unvollständiger Schlüssel: wie bisher einzeln prüfen
+                exists = self.db_record_exists(keys)
+            else:
+                exists = key in existing
+                # Derselbe Schlüssel weiter unten im Block wird nach dem Insert aktualisiert
+                existing.add(key)
+            (updates if exists else inserts).append(frappe_rec)
+
+        for frappe_rec in inserts:
+            self.queue_db_insert(frappe_rec)
+        # Inserts vor den Updates ausführen, falls ein Schlüssel im Block mehrfach vorkommt
+        self.flush_db_writes()
+        for frappe_rec in updates:
+            self.update_db_record(frappe_rec)
+        self.flush_db_writes()
 
+    def merge_db_records(self, frappe_records: list[dict]) -> tuple[list[Row], list[dict]]:
+        """
+        Schreibt den Block mengenbasiert über die Schlüsselspalten: MSSQL lädt die Datensätze in eine temporäre
+        Tabelle und wendet sie mit einem MERGE an, Firebird nutzt UPDATE OR INSERT ... MATCHING (per executemany).
+        Liefert die geschriebenen Zeilen (nur MSSQL, mit Spalte `merge_action`) und die Datensätze, die einzeln
+        geschrieben werden müssen (unvollständiger Schlüssel oder fehlgeschlagener MERGE).
+        """
+        remaining: list[dict] = []
+        # Pro Spaltenliste eine Gruppe, da fehlende (None-)Werte weder überschrieben noch eingefügt werden
+        groups: dict[tuple[str, ...], dict[tuple, tuple[dict, dict]]] = {}
         for frappe_rec in frappe_records:
-            data, key_values = self.split_frappe_in_data_and_keys(frappe_rec)
-
-            # Überprüfen, ob der Datensatz existiert
-            where_clause = " AND ".join([f"{self.esc_db_col(key)} = ?" for key in key_values.keys()])
-            select_sql = f"SELECT COUNT(*) FROM {self.config.table_name} WHERE {where_clause}"
-            params = list(key_values.values())
-            exists = False
-            cursor = self.db_conn.cursor()
+            db_data = self.map_frappe_to_db(frappe_rec)
+            key = self.get_db_key_tuple(db_data)
+            if key is None:
+                remaining.append(frappe_rec)
+                continue
+            # Mehrfach vorkommender Schlüssel: der letzte Datensatz gewinnt, wie bei Insert mit folgendem Update
+            for group in groups.values():
+                group.pop(key, None)
+            groups.setdefault(tuple(db_data), {})[key] = (frappe_rec, db_data)
+
+        written: list[Row] = []
+        for columns, group in groups.items():
+            if not group:
+                continue
+            if self.db_dialect != "mssql":
+                self._update_or_insert(columns, [db_data for _, db_data in group.values()])
+                continue
             try:
-                cursor.execute(select_sql, params)
-                exists = cursor.fetchone()[0] > 0
+                written.extend(self._merge_mssql(columns, [db_data for _, db_data in group.values()]))
             except Exception as e:
-                logging.error(f"Fehler beim Ausführen der Query '{format_query(select_sql, params)}'")
-                logging.error(e)
-            finally:
-                cursor.close()
+                logging.warning(f"MERGE in {self.config.table_name} fehlgeschlagen, schreibe einzeln: {e}")
+                remaining.extend(frappe_rec for frappe_rec, _ in group.values())
+        self.flush_db_writes()
+        if written:
+            inserted = sum(1 for row in written if row["merge_action"] == "INSERT")
+            logging.info(
+                f"MERGE in {self.config.table_name}: {inserted} eingefügt, {len(written) - inserted} aktualisiert."
+            )
+        return written, remaining
 
-            if exists:
-                self.update_db_record(frappe_rec)
-            else:
-                self.insert_frappe_record_to_db(frappe_rec)
+    def _update_or_insert(self, columns: tuple[str, ...], records: list[dict]):
+        escaped = [self.esc_db_col(column) for column in columns]
+        matching = ", ".join(self.esc_db_col(column) for column in self.get_db_key_columns())
+        sql = (
+            f"UPDATE OR INSERT INTO {self.config.table_name} ({', '.join(escaped)}) "
+            f"VALUES ({', '.join(['?'] * len(columns))}) MATCHING ({matching})"
+        )
+        for db_data in records:
+            self.queue_db_write(sql, [db_data[column] for column in columns], "DB-Datensatz wurde geschrieben.")
+
+    def _merge_mssql(self, columns: tuple[str, ...], records: list[dict]) -> list[Row]:
+        table = self.config.table_name
+        key_columns = self.get_db_key_columns()
+        escaped = [self.esc_db_col(column) for column in columns]
+        column_list = ", ".join(escaped)
+        on = " AND ".join(f"t.{self.esc_db_col(column)} = s.{self.esc_db_col(column)}" for column in key_columns)
+        update_set = ", ".join(
+            f"t.{esc} = s.{esc}" for column, esc in zip(columns, escaped) if column not in key_columns
+        )
+        output = ", ".join(f"inserted.{self.esc_db_col(column)}" for column in self.get_db_columns())
+        merge_sql = f"MERGE {table} WITH (HOLDLOCK) AS t USING {MSSQL_STAGING_TABLE} AS s ON {on}"
+        if update_set:
+            merge_sql += f" WHEN MATCHED THEN UPDATE SET {update_set}"
+        merge_sql += (
+            f" WHEN NOT MATCHED BY TARGET THEN INSERT ({column_list}) VALUES ({', '.join(f's.{esc}' for esc in escaped)})"
+            f" OUTPUT $action AS merge_action, {output};"
+        )
+        params = [[db_data[column] for column in columns] for db_data in records]
+        insert_sql = f"INSERT INTO {MSSQL_STAGING_TABLE} ({column_list}) VALUES ({', '.join(['?'] * len(columns))})"
+        if self.dry_run:
+            for row in params:
+                logging.info(f"DRY_RUN: {self.config.db_name}\n{format_query(insert_sql, row)}")
+            logging.info(f"DRY_RUN: {self.config.db_name}\n{merge_sql}")
+            return []
+
+        def run(cursor) -> list[Row]:
+            cursor.execute(
+                f"IF OBJECT_ID('tempdb..{MSSQL_STAGING_TABLE}') IS NOT NULL DROP TABLE {MSSQL_STAGING_TABLE}"
+            )
+            # Leere Kopie der Spaltentypen; durch UNION ALL wird keine IDENTITY-Eigenschaft übernommen
+            cursor.execute(
+                f"SELECT TOP 0 {column_list} INTO {MSSQL_STAGING_TABLE} FROM {table} "
+                f"UNION ALL SELECT TOP 0 {column_list} FROM {table}"
+            )
+            cursor.fast_executemany = self.db_writer.fast_executemany
+            cursor.executemany(insert_sql, params)
+            logging.debug(f"Anfrage an {self.config.db_name}\n{merge_sql}")
+            cursor.execute(merge_sql)
+            new_row = row_type(tuple(desc[0] for desc in cursor.description)).from_values
+            rows = [new_row(row) for row in cursor.fetchall()]
+            cursor.execute(f"DROP TABLE {MSSQL_STAGING_TABLE}")
+            return rows
+
+        return self.db_writer.execute_block(run, len(params))
+
+    def db_record_exists(self, db_keys: dict) -> bool:
+        if not db_keys:
+            return False
+        where_clause = " AND ".join([f"{self.esc_db_col(key)} = ?" for key in db_keys.keys()])
+        select_sql = f"SELECT COUNT(*) FROM {self.config.table_name} WHERE {where_clause}"
+        params = list(db_keys.values())
+        exists = False
+        cursor = self.db_conn.cursor()
+        try:
+            cursor.execute(select_sql, params)
+            exists = cursor.fetchone()[0] > 0
+        except Exception as e:
+            logging.error(f"Fehler beim Ausführen der Query '{format_query(select_sql, params)}'")
+            logging.error(e)
+        finally:
+            cursor.close()
+        return exists
@@ -4,7 +4,7 @@ import json
 import logging
 import os
 
-from api.database import DatabaseConnection
+from api.database import ConnectionPool, DatabaseConnection, DatabaseConnectionError
 from config import Config, TaskConfig
 from sync.bidirectional import BidirectionalSyncTask
 from sync.db_to_frappe import DbToFrappeSyncTask
@@ -13,6 +13,15 @@ from sync.frappe_to_db import FrappeToDbSyncTask
 from sync.task import SyncTaskBase
 from utils.history_db import SQLiteRunLogHandler, TaskHistoryDB
 
+# Felder, die nur die Ausführung betreffen und den Task-Hash (und damit das letzte Sync-Datum) nicht ändern
+TASK_HASH_EXCLUDE = {
+    "use_last_sync_date": True,
+    "delete": True,
+    "frappe": {"pagination": True},
+    "upsert": True,
+    "db": {"batch_size": True, "commit_policy": True, "commit_every": True, "returning": True},
+}
+
 
 def resolve_timestamp_path(config_path: str, timestamp_file: str) -> str:
     config_dir = os.path.dirname(config_path)
@@ -20,16 +29,25 @@ def resolve_timestamp_path(config_path: str, timestamp_file: str) -> str:
 
 
 class SyncManager:
-    def __init__(self, config: Config, config_path: str, history_db: TaskHistoryDB | None = None):
+    def __init__(
+        self,
+        config: Config,
+        config_path: str,
+        history_db: TaskHistoryDB | None = None,
+        connection_pool: ConnectionPool | None = None,
+    ):
         self.config = config
         if config.dry_run:
             logging.info("Sync läuft im Dry-Run Modus")
-        self.db_conn = DatabaseConnection(config.databases)
-        self.frappe_api = FrappeAPI(config.frappe, config.dry_run)
-        self.tasks = self._load_tasks(config.tasks)
         timestamp_path = resolve_timestamp_path(config_path, config.timestamp_file)
         self.history_db = history_db or TaskHistoryDB(timestamp_path)
         self._close_history_db = history_db is None
+        self.db_conn = DatabaseConnection(config.databases, connection_pool)
+        # Verbindungsaufbau vor dem ersten Task wird diesem zugerechnet
+        self._db_stats = {"connects": 0, "reuses": 0, "connect_seconds": 0.0}
+        # Die History-DB dient auch als Cache für Zeitzone und DocType-Metadaten
+        self.frappe_api = FrappeAPI(config.frappe, config.dry_run, metadata_cache=self.history_db)
+        self.tasks = self._load_tasks(config.tasks)
 
     def _load_tasks(self, task_configs: dict[str, TaskConfig]):
         tasks: list[SyncTaskBase] = []
@@ -61,7 +79,10 @@ class SyncManager:
 
         logging.info("Führe %s Task(s) aus: %s", len(tasks_to_run), ", ".join(task.name for task in tasks_to_run))
 
+        failed_databases: set[str] = set()
         try:
+            # Nur die Datenbanken der ausgewählten Tasks, gleichzeitig
+            self.db_conn.connect(task.config.db_name for task in tasks_to_run)
             for task in tasks_to_run:
                 last_sync_date_utc = self.get_last_sync_date(task.config)
                 started_at = datetime.now(timezone.utc).replace(tzinfo=None)
@@ -72,32 +93,90 @@ class SyncManager:
                 root_logger = logging.getLogger()
                 root_logger.addHandler(handler)
                 run_status: str | None = None
+                frappe_stats = self.frappe_api.get_stats()
                 try:
                     log = f"Starte Sync Task '{task.name}'"
                     if last_sync_date_utc:
                         log = log + f" ab {last_sync_date_utc}"
                     logging.info(log)
 
+                    task.prepare()
                     task.sync(last_sync_date_utc)
+                    task.commit_db_writes()
                     sync_date = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(
                         seconds=self.config.timestamp_buffer_seconds
                     )
                     self.save_sync_date(task.name, task.config, sync_date)
                     self.history_db.finish_run(run_id, "success", datetime.now(timezone.utc).replace(tzinfo=None))
                     run_status = "success"
+                except DatabaseConnectionError as e:
+                    # Betrifft nur die Tasks dieser Datenbank, die übrigen laufen weiter
+                    logging.error(f"Task '{task.name}' übersprungen: {e}")
+                    self.history_db.finish_run(run_id, "error", datetime.now(timezone.utc).replace(tzinfo=None))
+                    run_status = "error"
+                    failed_databases.add(task.config.db_name)
                 except Exception:
+                    task.rollback_db_writes()
                     self.history_db.finish_run(run_id, "error", datetime.now(timezone.utc).replace(tzinfo=None))
                     run_status = "error"
                     raise
                 finally:
+                    self._record_frappe_stats(run_id, frappe_stats)
+                    self._record_db_stats(run_id)
                     if run_status:
                         self._prune_task_runs(task.name, run_status)
                     root_logger.removeHandler(handler)
                     handler.close()
         finally:
             self.db_conn.close_connections()
+            self.frappe_api.close()
             if self._close_history_db:
                 self.history_db.close()
+        if failed_databases:
+            raise DatabaseConnectionError(f"Keine Verbindung zu den Datenbanken: {', '.join(sorted(failed_databases))}")
+
+    def _record_frappe_stats(self, run_id: int, stats_before: dict[str, float]):
+        stats = self.frappe_api.get_stats()
+        requests_count = stats["requests"] - stats_before["requests"]
+        connections = stats["connections"] - stats_before["connections"]
+        throttle_wait_seconds = stats["throttle_wait_seconds"] - stats_before["throttle_wait_seconds"]
+        logging.info(
+            "Frappe-Verbindungen: %s Request(s) über %s neue Verbindung(en), %s wiederverwendet, %.1fs gedrosselt",
+            requests_count,
+            connections,
+            max(requests_count - connections, 0),
+            throttle_wait_seconds,
+        )
+        self.history_db.save_run_metrics(
+            run_id,
+            {
+                "frappe_requests": requests_count,
+                "frappe_connections": connections,
+                "frappe_throttle_wait_seconds": round(throttle_wait_seconds, 3),
+            },
+        )
+
+    def _record_db_stats(self, run_id: int):
+        stats = self.db_conn.get_stats()
+        connects = stats["connects"] - self._db_stats["connects"]
+        reuses = stats["reuses"] - self._db_stats["reuses"]
+        connect_seconds = stats["connect_seconds"] - self._db_stats["connect_seconds"]
+        self._db_stats = stats
+        if connects or reuses:
+            logging.info(
+                "Datenbank-Verbindungen: %s neu aufgebaut (%.1fs), %s aus dem Pool wiederverwendet",
+                connects,
+                connect_seconds,
+                reuses,
+            )
+        self.history_db.save_run_metrics(
+            run_id,
+            {
+                "db_connects": connects,
+                "db_connection_reuses": reuses,
+                "db_connect_seconds": round(connect_seconds, 3),
+            },
+        )
 
     def get_last_sync_date(self, task_config: TaskConfig) -> datetime | None:
         if not task_config.use_last_sync_date:
@@ -115,14 +194,12 @@ class SyncManager:
         if status not in {"success", "error"}:
             return
         keep_last = (
-            self.config.max_success_runs_per_task
-            if status == "success"
-            else self.config.max_error_runs_per_task
+            self.config.max_success_runs_per_task if status == "success" else self.config.max_error_runs_per_task
         )
         self.history_db.prune_runs(task_name, status, keep_last)
 
 
 def gen_task_hash(task_config: TaskConfig):
-    task_dict = task_config.model_dump(exclude={"use_last_sync_date", "delete"})
+    task_dict = task_config.model_dump(exclude=TASK_HASH_EXCLUDE)
     json_data = json.dumps(task_dict, sort_keys=True).encode("utf-8")
     return hashlib.sha256(json_data).hexdigest()
@@ -1,17 +1,37 @@
 from abc import ABC, abstractmethod
+import asyncio
 from datetime import datetime, timedelta
-import json
+from decimal import Decimal
 import logging
-from typing import Generic, Literal, TypeVar
-
-from api.database import DatabaseConnection, format_query, get_time_zone
-from api.frappe import FrappeAPI
-from config import TaskConfig
+from typing import Awaitable, Callable, Generic, Iterable, Iterator, Literal, Mapping, TypeVar
+
+from api.database import (
+    RETURNING_DIALECTS,
+    BatchWriter,
+    DatabaseConnection,
+    format_query,
+    get_returning_clauses,
+    is_returning_unsupported,
+)
+from api.frappe import FrappeAPI, chunks
+from api.frappe_async import AsyncFrappeAPI
+from config import TaskConfig, TaskDbBase
+from utils.rows import Row, row_type
 
 T = TypeVar("T", bound=TaskConfig)
 
+# Höchstzahl gebundener Parameter pro Abfrage (MSSQL erlaubt 2100, Firebird höchstens 1500 Werte in einer IN-Liste)
+MAX_QUERY_PARAMS = {"mssql": 2000, "firebird": 1500}
+# Zeilen pro fetchmany beim Lesen aus der Datenbank
+DB_FETCH_SIZE = 1000
+# Firebird kennt keine VALUES-Liste; lange OR-Ketten übersteigen schnell die Verschachtelungstiefe des Parsers
+FIREBIRD_MAX_OR_KEYS = 250
+
 
 class SyncTaskBase(Generic[T], ABC):
+    # Wird gesetzt, wenn die Tabelle OUTPUT/RETURNING ablehnt (z. B. MSSQL-Tabelle mit Triggern)
+    _returning_unsupported = False
+
     def __init__(
         self, task_name: str, task_config: T, db_conn: DatabaseConnection, frappe_api: FrappeAPI, dry_run: bool
     ):
@@ -19,48 +39,119 @@ class SyncTaskBase(Generic[T], ABC):
         self.config = task_config
         self.frappe_api = frappe_api
         self.dry_run = dry_run
-        self.db_conn = db_conn.get_connection(self.config.db_name)
+        # Die Verbindung wird erst in prepare() geöffnet, damit nur die ausgeführten Tasks verbinden
+        self.database = db_conn
+        self.db_conn = None
         self.esc_db_col = db_conn.get_escape_identifier_fn(self.config.db_name)
+        self.db_dialect = db_conn.get_dialect(self.config.db_name)
+        self.db_writer: BatchWriter | None = None
         self.frappe_tz_delta = frappe_api.tz_delta or timedelta()
-        self.db_tz_delta = get_time_zone(self.db_conn) or timedelta()
+        self.db_tz_delta = timedelta()
+        self._frappe_inserts: list[dict] = []
+        self._frappe_updates: list[tuple[str, dict]] = []
+        self._frappe_deletes: list[str] = []
+        # Inserts mit manueller Id-Sequenz, die Ids werden beim Schreiben als Block vergeben
+        self._manual_id_inserts: list[dict] = []
+
+    def prepare(self):
+        """
+        Öffnet die Datenbankverbindung des Tasks und ermittelt die Zeitzone der Datenbank (pro Verbindung gecacht).
+        Wirft `DatabaseConnectionError`, wenn die Datenbank nicht erreichbar ist.
+        """
+        if self.db_conn is None:
+            self.db_conn = self.database.get_connection(self.config.db_name)
+            self.db_tz_delta = self.database.get_time_zone(self.config.db_name) or timedelta()
+            db_config = self.config.db or TaskDbBase(modified_fields=[])
+            self.db_writer = BatchWriter(
+                self.db_conn,
+                self.config.db_name,
+                db_config.batch_size,
+                self.dry_run,
+                self.database.use_fast_executemany(self.config.db_name),
+                self.db_dialect,
+                db_config.commit_policy,
+                db_config.commit_every,
+            )
 
     @abstractmethod
     def sync(self, last_sync_date_utc: datetime | None = None):
         """Führt die Synchronisation aus."""
         pass
 
-    def execute_query(self, sql: str, params: list, success_msg: str):
-        if self.dry_run:
-            logging.info(f"DRY_RUN: {self.config.db_name}\n{format_query(sql, params)}")
+    def queue_db_write(self, sql: str, params: list, success_msg: str, key=None):
+        """
+        Merkt eine schreibende Anweisung zum gesammelten Ausführen vor (siehe `BatchWriter`).
+        """
+        self.db_writer.add(sql, params, success_msg, key)
+
+    def flush_db_writes(self):
+        """
+        Führt alle vorgemerkten DB-Schreibzugriffe aus (committet wird gemäß `db.commit_policy`).
+        """
+        if self.db_writer:
+            self.db_writer.flush()
+            if self._manual_id_inserts:
+                records, self._manual_id_inserts = self._manual_id_inserts, []
+                self.insert_manual_id_block(records)
+
+    def commit_db_writes(self):
+        """
+        Führt alle vorgemerkten DB-Schreibzugriffe aus und committet sie, am Ende eines erfolgreichen Runs.
+        """
+        if self.db_writer:
+            self.flush_db_writes()
+            self.db_writer.commit()
+
+    def rollback_db_writes(self):
+        """
+        Behandelt nicht committete DB-Schreibzugriffe, wenn der Run fehlschlägt: Mit `commit_policy` `statement` oder
+        `batch` werden vorgemerkte Anweisungen noch ausgeführt und committet (z. B. die Fremdschlüssel bereits
+        angelegter Frappe-Dokumente), mit `run` wird die offene Transaktion verworfen.
+        """
+        if not self.db_writer:
             return
-        logging.debug(f"Anfrage an {self.config.db_name}\n{format_query(sql, params)}")
-        cursor = self.db_conn.cursor()
+        if self.db_writer.commit_policy != "run":
+            try:
+                self.commit_db_writes()
+                return
+            except Exception as e:
+                logging.error(f"Vorgemerkte Schreibzugriffe in {self.config.db_name} fehlgeschlagen: {e}")
+        self._manual_id_inserts = []
         try:
-            cursor.execute(sql, params)
-            self.db_conn.commit()
-            logging.info(success_msg)
+            self.db_writer.rollback()
         except Exception as e:
-            logging.error(f"Fehler beim Ausführen der Query '{format_query(sql, params)}'\n{e}")
+            logging.error(f"Rollback in {self.config.db_name} fehlgeschlagen: {e}")
+
+    def _rollback_failed_select(self):
+        # Eine fehlgeschlagene Abfrage darf keine noch nicht committeten Schreibzugriffe verwerfen
+        if not self.db_writer or not self.db_writer.uncommitted:
             self.db_conn.rollback()
-        finally:
-            cursor.close()
 
-    def _execute_select_query(self, sql: str, params: list | None = None):
+    def iter_select_query(self, sql: str, params: list | None = None) -> Iterator[Row]:
+        """
+        Führt eine Abfrage aus und liefert die Datensätze blockweise (`fetchmany`) als kompakte Zeilen, die sich einen
+        Spaltenindex teilen. Zeilen verhalten sich lesend wie dicts; `as_dict()` liefert bei Bedarf ein echtes dict.
+        """
         params = params or []
-        db_records: list[dict[str, any]] = []
         logging.debug(f"""Anfrage an {self.config.db_name}\n{format_query(sql, params)}""")
         cursor = self.db_conn.cursor()
         try:
             cursor.execute(sql, params)
-            db_columns = [desc[0] for desc in cursor.description]
-            for row in cursor.fetchall():
-                rec = dict(zip(db_columns, row))
-                db_records.append(rec)
+            new_row = row_type(tuple(desc[0] for desc in cursor.description)).from_values
+            while True:
+                rows = cursor.fetchmany(DB_FETCH_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    yield new_row(row)
         except Exception as e:
             logging.error(f"Fehler beim Ausführen der Query '{format_query(sql, params)}'\n{e}")
-            self.db_conn.rollback()
+            self._rollback_failed_select()
         finally:
             cursor.close()
+
+    def _execute_select_query(self, sql: str, params: list | None = None) -> list[Row]:
+        db_records = list(self.iter_select_query(sql, params))
         logging.debug(f"Insgesamt {len(db_records)} Datensätze gefunden.")
         return db_records
 
@@ -130,6 +221,13 @@ class SyncTaskBase(Generic[T], ABC):
                 db_data[db_column] = value
         return db_data
 
+    def map_db_keys_to_frappe(self, record: Mapping) -> dict:
+        """
+        Übersetzt nur die Schlüsselfelder eines DB-Datensatzes, z. B. für den Abgleich mit vorhandenen Dokumenten.
+        """
+        columns = dict.fromkeys(self.config.mapping[key_field] for key_field in self.config.key_fields)
+        return self.map_db_to_frappe({column: record[column] for column in columns if column in record}, warns=False)
+
     def map_db_to_frappe(self, record: dict, warns=True) -> dict:
         """
         Übersetzt einen DB-Datensatz in ein Frappe-Datenformat anhand des inversen Mapping.
@@ -163,34 +261,57 @@ class SyncTaskBase(Generic[T], ABC):
                 data[k] = v
         return data, keys
 
-    def _cast_frappe_record(self, record: dict):
+    def _cast_frappe_record(self, record: dict | Row):
+        """
+        Wandelt Datums- und Ganzzahlfelder (als String übertragen) um und liefert einen neuen Datensatz.
+        """
         if not self.config.frappe:
             return record
+        casted = {}
         for field in self.config.frappe.datetime_fields:
             if field in record and isinstance(record[field], str):
                 if not record[field]:
-                    record[field] = None
+                    casted[field] = None
                     continue
                 try:
-                    record[field] = datetime.fromisoformat(record[field])
+                    casted[field] = datetime.fromisoformat(record[field])
                 except ValueError:
                     # Falls der String kein gültiges ISO-Datum ist, bleibt der Wert unverändert.
                     pass
         for field in self.config.frappe.int_fields:
             if field in record and isinstance(record[field], str):
                 if not record[field]:
-                    record[field] = None
+                    casted[field] = None
                     continue
                 try:
-                    record[field] = int(record[field])
+                    casted[field] = int(record[field])
                 except ValueError:
-                    # Falls der String kein gültiges ISO-Datum ist, bleibt der Wert unverändert.
+                    # Falls der String keine gültige Ganzzahl ist, bleibt der Wert unverändert.
                     pass
-        return record
+        if not casted:
+            return record
+        if isinstance(record, Row):
+            return record.replace(casted)
+        return {**record, **casted}
 
-    def get_frappe_records(self, last_sync_date_utc: datetime | None = None) -> list:
+    def get_frappe_fields(self) -> list[str]:
         """
-        Frappe-Datensätze abrufen
+        Minimale Feldliste für Frappe-Abfragen: Mapping-, Schlüssel-, Änderungs- und Id-Felder.
+        """
+        fields = list(self.config.mapping.keys()) + list(self.config.key_fields)
+        if self.config.frappe:
+            fields.extend(self.config.frappe.modified_fields)
+            fields.append(self.config.frappe.id_field)
+            fk_id_field = getattr(self.config.frappe, "fk_id_field", None)
+            if fk_id_field:
+                fields.append(fk_id_field)
+        else:
+            fields.append("name")
+        return list(dict.fromkeys(fields))
+
+    def iter_frappe_records(self, last_sync_date_utc: datetime | None = None):
+        """
+        Frappe-Datensätze seitenweise abrufen
         """
         filters = []
         if last_sync_date_utc:
@@ -199,19 +320,24 @@ class SyncTaskBase(Generic[T], ABC):
             last_sync_date = last_sync_date_utc + self.frappe_tz_delta
             for modified_field in self.config.frappe.modified_fields:
                 filters.append(f'["{modified_field}", ">=", "{last_sync_date.isoformat()}"]')
-        frappe_response = self.frappe_api.get_all_data(self.config.doc_type, filters, or_filters=True)
-        records = frappe_response.get("data", [])
+        pagination = self.config.frappe.pagination if self.config.frappe else None
+        if pagination is None:
+            pagination = "keyset" if last_sync_date_utc else "offset"
+        records = self.frappe_api.iter_all_rows(
+            self.config.doc_type, filters, or_filters=True, pagination=pagination, fields=self.get_frappe_fields()
+        )
         for rec in records:
-            self._cast_frappe_record(rec)
-        return records
+            yield self._cast_frappe_record(rec)
+
+    def get_frappe_records(self, last_sync_date_utc: datetime | None = None) -> list:
+        """
+        Frappe-Datensätze abrufen
+        """
+        return list(self.iter_frappe_records(last_sync_date_utc))
 
     def get_frappe_records_by_ids(self, ids: list[str | int]):
-        filters = [f'["name", "in", {json.dumps(ids)}]']
-        frappe_response = self.frappe_api.get_all_data(self.config.doc_type, filters)
-        records = frappe_response.get("data", [])
-        for rec in records:
-            self._cast_frappe_record(rec)
-        return records
+        records = self.frappe_api.iter_rows_by_values(self.config.doc_type, "name", ids, self.get_frappe_fields())
+        return [self._cast_frappe_record(rec) for rec in records]
 
     def get_frappe_key_record_dict(self, frappe_records: list[dict[str, any]]):
         frappe_dict: dict[tuple, dict[str, any]] = {}
@@ -220,11 +346,34 @@ class SyncTaskBase(Generic[T], ABC):
             frappe_dict[key] = rec
         return frappe_dict
 
-    def get_db_records(self, last_sync_date_utc: datetime | None = None):
+    def get_db_columns(self) -> list[str]:
+        """
+        Minimale Spaltenliste für Abfragen auf `table_name`: Mapping-, Id-, Fremdschlüssel- und Änderungsspalten.
+        """
+        columns = list(self.config.mapping.values())
+        if self.config.db:
+            columns.extend(self.config.db.modified_fields)
+            for field in ("id_field", "fk_id_field"):
+                column = getattr(self.config.db, field, None)
+                if column:
+                    columns.append(column)
+        return list(dict.fromkeys(columns))
+
+    def get_db_select_list(self) -> str:
+        return ", ".join(self.esc_db_col(column) for column in self.get_db_columns())
+
+    def get_db_records(self, last_sync_date_utc: datetime | None = None) -> list[Row]:
         """
         DB-Datensätze abrufen
         """
-        select_sql = f"SELECT * FROM {self.config.table_name}"
+        return list(self.iter_db_records(last_sync_date_utc))
+
+    def iter_db_records(self, last_sync_date_utc: datetime | None = None) -> Iterator[Row]:
+        """
+        DB-Datensätze blockweise abrufen (siehe `iter_select_query`), ohne sie vorab vollständig zu laden.
+        Solange iteriert wird, ist der Cursor offen: auf MSSQL (ohne MARS) keine weiteren Abfragen über die Verbindung.
+        """
+        select_sql = f"SELECT {self.get_db_select_list()} FROM {self.config.table_name}"
         params = []
         if last_sync_date_utc:
             if not self.config.db:
@@ -232,7 +381,7 @@ class SyncTaskBase(Generic[T], ABC):
             last_sync_date = last_sync_date_utc + self.db_tz_delta
             is_first_condition = True
             for modified_field in self.config.db.modified_fields:
-                conjunction = "WHERE" if is_first_condition else " OR"
+                conjunction = " WHERE" if is_first_condition else " OR"
                 select_sql = select_sql + f"{conjunction} {self.esc_db_col(modified_field)} >= ?"
                 params.append(last_sync_date)
                 is_first_condition = False
@@ -244,23 +393,96 @@ class SyncTaskBase(Generic[T], ABC):
                 select_sql = self.config.query_with_timestamp
                 params = [last_sync_date] * self.config.query_with_timestamp.count("?")
 
-        return self._execute_select_query(select_sql, params)
+        return self.iter_select_query(select_sql, params)
 
     def get_db_records_by_ids(self, ids: list[str | int]):
-        select_sql = f"SELECT * FROM {self.config.table_name}"
-        id_selector = f"{self.esc_db_col(self.config.db.id_field)} IN ({', '.join(['?']*len(ids))})"
+        db_records = []
+        # In Blöcken, damit die Parametergrenze der Datenbank nicht überschritten wird
+        for chunk in chunks(ids, self._db_chunk_size(1)):
+            select_sql = f"SELECT {self.get_db_select_list()} FROM {self.config.table_name}"
+            id_selector = f"{self.esc_db_col(self.config.db.id_field)} IN ({', '.join(['?']*len(chunk))})"
+
+            if self.config.query:
+                q = self.config.query.strip()
+                select_sql = q[:-1] if q.endswith(";") else q
+
+            if "WHERE" in select_sql:
+                select_sql = select_sql + f" AND {id_selector}"
+            else:
+                select_sql = select_sql + f" WHERE {id_selector}"
+            db_records.extend(self.iter_select_query(select_sql, chunk))
+        return db_records
 
-        if self.config.query:
-            q = self.config.query.strip()
-            select_sql = q[:-1] if q.endswith(";") else q
+    def _db_batch_size(self) -> int:
+        return self.config.db.batch_size if self.config.db else TaskDbBase.model_fields["batch_size"].default
 
-        if "WHERE" in select_sql:
-            select_sql = select_sql + f" AND {id_selector}"
-        else:
-            select_sql = select_sql + f" WHERE {id_selector}"
-        return self._execute_select_query(select_sql, ids)
+    def _db_chunk_size(self, columns: int) -> int:
+        limit = MAX_QUERY_PARAMS.get(self.db_dialect, MAX_QUERY_PARAMS["firebird"]) // max(columns, 1)
+        if columns > 1 and self.db_dialect != "mssql":
+            limit = min(limit, FIREBIRD_MAX_OR_KEYS)
+        return max(1, min(self._db_batch_size(), limit))
+
+    def get_db_key_columns(self) -> list[str]:
+        return [self.config.mapping[field] for field in self.config.key_fields]
+
+    def get_db_key_tuple(self, db_keys: dict) -> tuple | None:
+        """
+        Normalisierter Schlüssel aus den DB-Schlüsselspalten, None falls eine Schlüsselspalte fehlt.
+        """
+        columns = self.get_db_key_columns()
+        if any(column not in db_keys for column in columns):
+            return None
+        # Firebird vergleicht Texte standardmäßig mit Groß-/Kleinschreibung
+        casefold = self.db_dialect == "mssql"
+        return tuple(normalize_key_value(db_keys[column], casefold=casefold) for column in columns)
+
+    def get_existing_db_keys(self, db_keys: list[dict]) -> set[tuple]:
+        """
+        Normalisierte Schlüssel (siehe `get_db_key_tuple`) der Datensätze, die bereits in der Tabelle existieren.
+        Eine Abfrage pro Block: `IN`-Liste bei einspaltigen Schlüsseln, sonst Join gegen eine `VALUES`-Liste (MSSQL)
+        bzw. OR-verknüpfte Bedingungen (Firebird).
+        """
+        columns = self.get_db_key_columns()
+        db_keys = [keys for keys in db_keys if self.get_db_key_tuple(keys) is not None]
+        existing: set[tuple] = set()
+        for chunk in chunks(db_keys, self._db_chunk_size(len(columns))):
+            sql, params = self._existing_keys_query(columns, chunk)
+            for values in self._execute_select_values(sql, params):
+                existing.add(self.get_db_key_tuple(dict(zip(columns, values))))
+        return existing
+
+    def _existing_keys_query(self, columns: list[str], db_keys: list[dict]):
+        escaped = [self.esc_db_col(column) for column in columns]
+        select_sql = f"SELECT {', '.join(f't.{col}' for col in escaped)} FROM {self.config.table_name} t"
+        params = [keys[column] for keys in db_keys for column in columns]
+        if len(columns) == 1:
+            return f"{select_sql} WHERE t.{escaped[0]} IN ({', '.join(['?'] * len(db_keys))})", params
+        if self.db_dialect == "mssql":
+            row = f"({', '.join(['?'] * len(columns))})"
+            aliases = ", ".join(f"k{i}" for i in range(len(columns)))
+            on = " AND ".join(f"t.{col} = v.k{i}" for i, col in enumerate(escaped))
+            return f"{select_sql} JOIN (VALUES {', '.join([row] * len(db_keys))}) AS v({aliases}) ON {on}", params
+        condition = "(" + " AND ".join(f"t.{col} = ?" for col in escaped) + ")"
+        return f"{select_sql} WHERE {' OR '.join([condition] * len(db_keys))}", params
+
+    def _execute_select_values(self, sql: str, params: list):
+        """
+        Führt eine Abfrage aus und liefert die Zeilen als Tupel. Fehler werden nicht verschluckt, da ein
+        fehlendes Ergebnis hier zu doppelten Inserts führen würde.
+        """
+        logging.debug(f"Anfrage an {self.config.db_name}\n{format_query(sql, params)}")
+        cursor = self.db_conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            return [tuple(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logging.error(f"Fehler beim Ausführen der Query '{format_query(sql, params)}'\n{e}")
+            self._rollback_failed_select()
+            raise
+        finally:
+            cursor.close()
 
-    def get_db_key_record_dict(self, db_records: list[dict[str, any]]):
+    def get_db_key_record_dict(self, db_records: Iterable[dict[str, any]]):
         db_dict: dict[tuple, dict[str, any]] = {}
         for rec in db_records:
             key = self.extract_key_from_db(rec)
@@ -282,29 +504,92 @@ class SyncTaskBase(Generic[T], ABC):
             key_values.append(record.get(self.config.mapping[field]))
         return tuple(key_values)
 
-    def insert_db_record_to_frappe(self, db_rec: dict):
+    def queue_frappe_insert(self, db_rec: dict):
         """
-        Fügt einen neuen Datensatz in Frappe ein, basierend auf den Daten aus der DB.
+        Merkt einen DB-Datensatz zum gesammelten Einfügen in Frappe vor.
         """
         if self.config.create_new:
-            frappe_data = self.map_db_to_frappe(db_rec)
-            res = self.frappe_api.insert_data(self.config.doc_type, frappe_data)
-            if res:
-                return res.get("data")
+            self._frappe_inserts.append(db_rec)
+            if len(self._frappe_inserts) >= self._frappe_write_buffer_size():
+                self.flush_frappe_inserts()
+
+    def queue_frappe_update(self, db_rec: dict, frappe_doc_name: str):
+        """
+        Merkt die Aktualisierung eines Frappe-Datensatzes mit den Werten aus dem DB-Datensatz vor.
+        """
+        frappe_data, _ = self.split_frappe_in_data_and_keys(self.map_db_to_frappe(db_rec))
+        self.queue_frappe_data_update(frappe_doc_name, frappe_data)
+
+    def queue_frappe_data_update(self, frappe_doc_name: str, data: dict):
+        self._frappe_updates.append((frappe_doc_name, data))
+        if len(self._frappe_updates) >= self._frappe_write_buffer_size():
+            self.flush_frappe_updates()
 
-    def update_frappe_record(self, db_rec: dict, frappe_doc_name: str):
+    def queue_frappe_delete(self, frappe_doc_name: str):
+        self._frappe_deletes.append(frappe_doc_name)
+        if len(self._frappe_deletes) >= self._frappe_write_buffer_size():
+            self.flush_frappe_deletes()
+
+    def _frappe_write_buffer_size(self):
+        # Genug vormerken, damit alle parallelen Sammel-Requests gefüllt sind
+        return self.frappe_api.config.write_batch_size * self.frappe_api.config.write_concurrency
+
+    def _run_frappe_writes(self, call: Callable[[AsyncFrappeAPI], Awaitable[list]]):
+        async def run():
+            return await call(AsyncFrappeAPI(self.frappe_api))
+
+        return asyncio.run(run())
+
+    def flush_frappe_inserts(self):
+        db_recs, self._frappe_inserts = self._frappe_inserts, []
+        if not db_recs:
+            return
+        docs = [self.map_db_to_frappe(db_rec) for db_rec in db_recs]
+        results = self._run_frappe_writes(
+            lambda api: api.insert_many(self.config.doc_type, docs, list(self.config.key_fields), self.get_index_key)
+        )
+        for db_rec, res in zip(db_recs, results):
+            if res and res.get("data"):
+                self.on_frappe_record_inserted(db_rec, res["data"])
+        # Die dabei vorgemerkten DB-Schreibzugriffe (z. B. Fremdschlüssel) direkt ausführen, damit sie bei einem
+        # späteren Fehler im Run nicht verloren gehen
+        self.flush_db_writes()
+
+    def flush_frappe_updates(self):
+        updates, self._frappe_updates = self._frappe_updates, []
+        if updates:
+            self._run_frappe_writes(lambda api: api.update_many(self.config.doc_type, updates))
+
+    def flush_frappe_deletes(self):
+        doc_names, self._frappe_deletes = self._frappe_deletes, []
+        if doc_names:
+            self._run_frappe_writes(lambda api: api.delete_many(self.config.doc_type, doc_names))
+
+    def flush_frappe_writes(self):
         """
-        Aktualisiert einen vorhandenen Frappe-Datensatz mit den Werten aus dem DB-Datensatz.
+        Sendet alle vorgemerkten Frappe-Schreibzugriffe.
         """
-        frappe_rec = self.map_db_to_frappe(db_rec)
-        frappe_data, frappe_keys = self.split_frappe_in_data_and_keys(frappe_rec)
-        res = self.frappe_api.update_data(self.config.doc_type, frappe_doc_name, frappe_data)
-        if res:
-            return res.get("data")
+        self.flush_frappe_inserts()
+        self.flush_frappe_updates()
+        self.flush_frappe_deletes()
+
+    def on_frappe_record_inserted(self, db_rec: dict, frappe_doc: dict):
+        """
+        Wird nach dem gesammelten Einfügen für jedes erfolgreich angelegte Frappe-Dokument aufgerufen.
+        """
+        pass
+
+    def get_index_key(self, data: Mapping) -> tuple | None:
+        """
+        Normalisierter Schlüssel aus den Frappe-Daten, None falls ein Schlüsselfeld fehlt.
+        """
+        if any(key_field not in data for key_field in self.config.key_fields):
+            return None
+        return tuple(normalize_key_value(data[key_field]) for key_field in self.config.key_fields)
 
     def update_db_record(self, frappe_rec: dict):
         """
-        Aktualisiert einen vorhandenen DB-Datensatz mit den Werten aus dem Frappe-Datensatz.
+        Merkt die Aktualisierung eines vorhandenen DB-Datensatzes mit den Werten aus dem Frappe-Datensatz vor.
         """
         frappe_rec_data, frappe_rec_keys = self.split_frappe_in_data_and_keys(frappe_rec)
         db_data = self.map_frappe_to_db(frappe_rec_data, warns=False)
@@ -313,85 +598,244 @@ class SyncTaskBase(Generic[T], ABC):
         set_clause = ", ".join([f"{self.esc_db_col(col)} = ?" for col in db_data.keys()])
         sql = f"UPDATE {self.config.table_name} SET {set_clause} WHERE {where_clause}"
         params = list(db_data.values()) + list(db_keys.values())
-        self.execute_query(sql, params, f"DB-Datensatz wurde aktualisiert.")
+        self.queue_db_write(sql, params, "DB-Datensatz wurde aktualisiert.", key=tuple(db_keys.items()))
+
+    def _db_insert_query(self, data: dict, returning=False):
+        columns = ", ".join(self.esc_db_col(k) for k in data.keys())
+        placeholders = ", ".join(["?"] * len(data))
+        output, returning_clause = "", ""
+        if returning:
+            output, returning_clause = get_returning_clauses(
+                self.db_dialect, [self.esc_db_col(column) for column in self.get_db_columns()]
+            )
+        sql = f"INSERT INTO {self.config.table_name} ({columns}){output} VALUES ({placeholders}){returning_clause};"
+        return sql, list(data.values())
+
+    def _use_returning(self) -> bool:
+        """
+        Ob geschriebene Zeilen per OUTPUT/RETURNING gelesen werden; sonst werden sie wie bisher erneut abgefragt.
+        """
+        return (
+            not self.dry_run
+            and self.config.db.returning
+            and not self._returning_unsupported
+            and self.db_dialect in RETURNING_DIALECTS
+        )
+
+    def _check_returning_error(self, error: Exception) -> bool:
+        """
+        Schaltet OUTPUT/RETURNING für den restlichen Run ab, wenn die Tabelle es ablehnt; liefert dann True.
+        """
+        if not is_returning_unsupported(error):
+            return False
+        logging.warning(
+            f"{self.config.table_name} unterstützt keine Rückgabe geschriebener Zeilen, frage stattdessen erneut ab. "
+            f"Mit 'db.returning: false' entfällt der Versuch: {error}"
+        )
+        self._returning_unsupported = True
+        return True
+
+    def _execute_returning(self, sql: str, params: list, success_msg: str) -> Row | None:
+        """
+        Führt eine schreibende Anweisung mit OUTPUT/RETURNING aus und liefert die geschriebene Zeile. Lehnt die
+        Tabelle die Rückgabe ab, wird nichts geschrieben und `_use_returning()` liefert danach False.
+        """
+
+        def run(cursor) -> Row | None:
+            logging.debug(f"Anfrage an {self.config.db_name}\n{format_query(sql, params)}")
+            cursor.execute(sql, params)
+            return self._fetch_written_row(cursor)
+
+        try:
+            row = self.db_writer.execute_block(run, 1)
+        except Exception as e:
+            if not self._check_returning_error(e):
+                logging.error(f"Fehler beim Ausführen der Query '{format_query(sql, params)}'\n{e}")
+            return None
+        logging.info(success_msg)
+        return row
+
+    @staticmethod
+    def _fetch_written_row(cursor) -> Row | None:
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return row_type(tuple(desc[0] for desc in cursor.description)).from_values(row)
+
+    def queue_db_insert(self, frappe_rec: dict):
+        """
+        Merkt das Einfügen eines Frappe-Datensatzes in die DB vor, wenn der angelegte Datensatz nicht benötigt wird.
+        Mit manueller Id-Sequenz werden die Ids beim Schreiben für alle vorgemerkten Inserts als Block vergeben.
+        """
+        if not self.config.create_new:
+            return
+        db_data = self.map_frappe_to_db(frappe_rec)
+        if self.config.db.manual_id_sequence:
+            self._manual_id_inserts.append(db_data)
+            return
+        sql, params = self._db_insert_query(db_data)
+        self.queue_db_write(sql, params, "Neuer DB-Datensatz wurde eingefügt.")
+
+    def insert_manual_id_block(self, records: list[dict], returning=False) -> list[dict | None]:
+        """
+        Fügt Datensätze mit manueller Id-Sequenz ein: Die Ids des ganzen Blocks werden mit einer Abfrage reserviert
+        (MAX + 1 bis MAX + n, begrenzt durch `manual_id_sequence_max`) und alle Inserts in einer Transaktion
+        geschrieben. Auf MSSQL hält die Tabellensperre damit einen Block lang statt pro Datensatz.
+        Schlägt der Block fehl, wird er einzeln wiederholt. Liefert pro Datensatz die eingefügten Werte samt Id,
+        mit `returning` die per OUTPUT/RETURNING gelesene Zeile (None bei Fehlern).
+        """
+        # Die Sperre hält bis zum Commit: ausstehende Schreibzugriffe vorher committen, damit ein Rollback des
+        # Blocks sie nicht verwirft, und den Block direkt danach
+        self.db_writer.commit()
+        try:
+            written = self._insert_manual_id_block(records, returning)
+        except Exception as e:
+            if returning and self._check_returning_error(e):
+                return self.insert_manual_id_block(records)
+            if len(records) == 1:
+                logging.error(f"Fehler bei manuellem Insert, rolle zurück: {e}")
+                return [None]
+            logging.warning(f"Block mit manueller Id-Sequenz fehlgeschlagen, wiederhole einzeln: {e}")
+            return [self.insert_manual_id_block([record], returning)[0] for record in records]
+        self.db_writer.commit()
+        return written
+
+    def _insert_manual_id_block(self, records: list[dict], returning: bool) -> list[dict]:
+        id_field = self.config.db.id_field
+        id_max = self.config.db.manual_id_sequence_max
+        sql_next = f"SELECT COALESCE(MAX({self.esc_db_col(id_field)}), 0) FROM {self.config.table_name}"
+        if self.db_dialect == "mssql" and not self.dry_run:
+            # Exklusive Tabellensperre bis zum Commit, damit parallele Schreiber keine Id doppelt vergeben
+            sql_next += " WITH (TABLOCKX, HOLDLOCK)"
+        params_next = []
+        if id_max is not None:
+            sql_next += f" WHERE {self.esc_db_col(id_field)} < ?"
+            params_next.append(id_max)
+
+        def run(cursor) -> list[dict]:
+            logging.debug(f"Anfrage an {self.config.db_name}\n{format_query(sql_next, params_next)}")
+            cursor.execute(sql_next, params_next)
+            first = cursor.fetchone()[0] + 1
+            ids = list(range(first, first + len(records)))
+            if id_max is not None and ids[-1] >= id_max:
+                raise Exception(
+                    f"Manuell errechnete IDs ({ids[0]} bis {ids[-1]}) übersteigen manual_id_sequence_max ({id_max})"
+                )
+            written = [{**db_data, id_field: next_nr} for next_nr, db_data in zip(ids, records)]
+            if returning:
+                # OUTPUT/RETURNING liefert pro Anweisung eine Zeile, daher einzeln statt per executemany
+                for i, db_data in enumerate(written):
+                    sql, params = self._db_insert_query(db_data, returning=True)
+                    logging.debug(f"Anfrage an {self.config.db_name}\n{format_query(sql, params)}")
+                    cursor.execute(sql, params)
+                    written[i] = self._fetch_written_row(cursor)
+                logging.info(f"{len(ids)} neue DB-Datensätze mit manuellen Ids {ids[0]} bis {ids[-1]} eingefügt.")
+                return written
+            groups: dict[str, list[list]] = {}
+            for db_data in written:
+                sql, params = self._db_insert_query(db_data)
+                groups.setdefault(sql, []).append(params)
+            for sql, rows in groups.items():
+                if self.dry_run:
+                    for params in rows:
+                        logging.info(f"DRY_RUN: {self.config.db_name}\n{format_query(sql, params)}")
+                    continue
+                logging.debug(
+                    f"Anfrage an {self.config.db_name} ({len(rows)} Datensätze)\n{format_query(sql, rows[0])}"
+                )
+                if self.db_writer.fast_executemany:
+                    cursor.fast_executemany = True
+                cursor.executemany(sql, rows)
+            if not self.dry_run:
+                logging.info(f"{len(ids)} neue DB-Datensätze mit manuellen Ids {ids[0]} bis {ids[-1]} eingefügt.")
+            return written
 
-        sql_select = f"SELECT * FROM {self.config.table_name} WHERE {where_clause}"
-        results = self._execute_select_query(sql_select, list(db_keys.values()))
+        if self.dry_run:
+            cursor = self.db_conn.cursor()
+            try:
+                return run(cursor)
+            finally:
+                cursor.close()
+        return self.db_writer.execute_block(run, len(records))
+
+    def insert_frappe_record_to_db(self, frappe_rec: dict):
+        """
+        Fügt einen neuen Datensatz in die DB ein, basierend auf den Daten aus Frappe, und liefert die eingefügte Zeile
+        (siehe `insert_frappe_records_to_db`).
+        """
+        return self.insert_frappe_records_to_db([frappe_rec])[0]
+
+    def insert_frappe_records_to_db(self, frappe_recs: list[dict]) -> list[Row | None]:
+        """
+        Fügt neue Datensätze in die DB ein, basierend auf den Daten aus Frappe, und liefert pro Datensatz die
+        eingefügte Zeile (None bei Fehlern): per OUTPUT/RETURNING aus derselben Anweisung oder, falls nicht
+        verfügbar, durch erneutes Abfragen. Mit manueller Id-Sequenz wird ein Id-Block für alle Datensätze reserviert.
+        """
+        if not self.config.create_new or not frappe_recs:
+            return [None] * len(frappe_recs)
+        # Vorgemerkte Schreibzugriffe zuerst, die neuen Datensätze werden direkt danach gelesen
+        self.flush_db_writes()
+        db_records = [self.map_frappe_to_db(frappe_rec) for frappe_rec in frappe_recs]
+
+        if self.config.db.manual_id_sequence:
+            returning = self._use_returning()
+            written = self.insert_manual_id_block(db_records, returning)
+            if returning and self._use_returning():
+                return written
+            id_field = self.config.db.id_field
+            ids = [record[id_field] for record in written if record is not None]
+            by_id = {normalize_key_value(row.get(id_field)): row for row in self.get_db_records_by_ids(ids)}
+            created = []
+            for record in written:
+                row = by_id.get(normalize_key_value(record[id_field])) if record is not None else None
+                if record is not None and row is None:
+                    logging.warning(f"DB-Datensatz mit manueller Id {record[id_field]} nicht gefunden.")
+                created.append(row)
+            return created
+
+        created: list[Row | None] = [None] * len(frappe_recs)
+        remaining = list(range(len(frappe_recs)))
+        while remaining and self._use_returning():
+            sql, params = self._db_insert_query(db_records[remaining[0]], returning=True)
+            row = self._execute_returning(sql, params, "Neuer DB-Datensatz wurde eingefügt.")
+            if self._use_returning():
+                created[remaining.pop(0)] = row
+
+        # Ohne OUTPUT/RETURNING (oder nachdem die Tabelle es abgelehnt hat): einfügen und erneut abfragen
+        for i in remaining:
+            sql, params = self._db_insert_query(db_records[i])
+            self.queue_db_write(sql, params, "Neuer DB-Datensatz wurde eingefügt.")
+        self.flush_db_writes()
+        for i in remaining:
+            created[i] = self._select_inserted_record(frappe_recs[i])
+        return created
+
+    def _select_inserted_record(self, frappe_rec: dict) -> Row | None:
+        _, frappe_rec_keys = self.split_frappe_in_data_and_keys(frappe_rec)
+        db_only_keys = self.map_frappe_to_db(frappe_rec_keys, warns=False)
+        where_clause = " AND ".join([f"{self.esc_db_col(k)} = ?" for k in db_only_keys.keys()])
+        sql_select = f"SELECT {self.get_db_select_list()} FROM {self.config.table_name} WHERE {where_clause}"
+        results = self._execute_select_query(sql_select, list(db_only_keys.values()))
         if len(results) == 0:
-            logging.warning(f"DB-Datensatz konnte nach UPDATE nicht gefunden werden: {db_keys}")
+            logging.warning(f"DB-Datensatz konnte nach UPDATE nicht gefunden werden: {db_only_keys}")
             return None
         elif len(results) == 1:
             return results[0]
         else:
-            logging.warning(f"Nach UPDATE konnten mehrere DB-Datensätze gefunden werden: {db_keys}")
+            logging.warning(f"Nach UPDATE konnten mehrere DB-Datensätze gefunden werden: {db_only_keys}")
             return results[0]
 
-    def insert_frappe_record_to_db(self, frappe_rec: dict):
-        """
-        Fügt einen neuen Datensatz in die DB ein, basierend auf den Daten aus Frappe.
-        """
-        if self.config.create_new:
-            frappe_rec_data, frappe_rec_keys = self.split_frappe_in_data_and_keys(frappe_rec)
-            db_only_keys = self.map_frappe_to_db(frappe_rec_keys, warns=False)
-            db_data = self.map_frappe_to_db(frappe_rec)
-
-            def insert_query(data: dict):
-                columns = ", ".join(self.esc_db_col(k) for k in data.keys())
-                placeholders = ", ".join(["?"] * len(data))
-                sql = f"INSERT INTO {self.config.table_name} ({columns}) VALUES ({placeholders});"
-                params = list(data.values())
-                return sql, params
-
-            if self.config.db.manual_id_sequence:
-                conn = self.db_conn
-                cursor = conn.cursor()
-                try:
-                    sql_next = (
-                        f"SELECT ISNULL(MAX({self.config.db.id_field}), 0) + 1 FROM {self.config.table_name}"
-                        f"{'' if self.dry_run else ' WITH (TABLOCKX, HOLDLOCK)'}"
-                        f"{';' if self.config.db.manual_id_sequence_max is None else f' WHERE {self.config.db.id_field} < {self.config.db.manual_id_sequence_max};'}"
-                    )
-                    logging.debug(f"Anfrage an {self.config.db_name}\n{format_query(sql_next, [])}")
-                    cursor.execute(sql_next)
-                    next_nr = cursor.fetchone()[0]
-                    if (
-                        self.config.db.manual_id_sequence_max is not None
-                        and next_nr >= self.config.db.manual_id_sequence_max
-                    ):
-                        raise Exception(
-                            f"Manuelle errechnete nächste ID ({next_nr}) übersteigt manual_id_sequence_max ({self.config.db.manual_id_sequence_max})"
-                        )
-                    db_data[self.config.db.id_field] = next_nr
-                    db_only_keys[self.config.db.id_field] = next_nr
-
-                    sql, params = insert_query(db_data)
-                    if self.dry_run:
-                        logging.info(f"DRY_RUN: {self.config.db_name}\n{format_query(sql, params)}")
-                    else:
-                        logging.debug(f"Anfrage an {self.config.db_name}\n{format_query(sql, params)}")
-                        cursor.execute(sql, params)
-                        logging.info(f"Neuer DB-Datensatz mit manueller Id {next_nr} eingefügt.")
-                        self.db_conn.commit()
-
-                except Exception as e:
-                    self.db_conn.rollback()
-                    logging.error(f"Fehler bei manuellem Insert, rolle zurück: {e}")
-                    return None
-
-                finally:
-                    cursor.close()
-            else:
-                sql, params = insert_query(db_data)
-                self.execute_query(sql, params, f"Neuer DB-Datensatz wurde eingefügt.")
-
-            where_clause = " AND ".join([f"{self.esc_db_col(k)} = ?" for k in db_only_keys.keys()])
-            sql_select = f"SELECT * FROM {self.config.table_name} WHERE {where_clause}"
-            results = self._execute_select_query(sql_select, list(db_only_keys.values()))
-            if len(results) == 0:
-                logging.warning(f"DB-Datensatz konnte nach UPDATE nicht gefunden werden: {db_only_keys}")
-                return None
-            elif len(results) == 1:
-                return results[0]
-            else:
-                logging.warning(f"Nach UPDATE konnten mehrere DB-Datensätze gefunden werden: {db_only_keys}")
-                return results[0]
+
+def normalize_key_value(value, casefold: bool = True):
+    """
+    Vergleichswert für Schlüssel über Systemgrenzen hinweg: Zahlen unabhängig von Typ und Nachkommastellen,
+    Texte ohne Leerzeichen am Ende und ohne Groß-/Kleinschreibung (wie die Vergleiche in MariaDB und MSSQL).
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float, Decimal)):
+        return format(Decimal(str(value)).normalize(), "f")
+    value = str(value).rstrip()
+    return value.casefold() if casefold else value
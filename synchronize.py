@@ -2,6 +2,7 @@ import argparse
 import logging
 import sys
 
+from api.database import DatabaseConnectionError
 from sync.manager import SyncManager
 from utils.config_loader import load_config_file
 
@@ -34,7 +35,12 @@ def main():
         sys.exit(1)
 
     sync_manager = SyncManager(config, args.config)
-    sync_manager.run()
+    try:
+        sync_manager.run()
+    except DatabaseConnectionError as e:
+        # Die Tasks der übrigen Datenbanken sind bereits gelaufen
+        logger.error(e)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,217 @@
+from datetime import timedelta
+import threading
+
+import pytest
+
+from api.database import BatchWriter, ConnectionPool, DatabaseConnection, DatabaseConnectionError
+from config import MssqlDatabaseConfig
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.fast_executemany = False
+
+    def execute(self, sql, params=None):
+        if not self.conn.alive or params in self.conn.failing:
+            raise RuntimeError("connection lost")
+        self.conn.executed.append(sql)
+        self.conn.writes.append(("execute", sql, params))
+
+    def executemany(self, sql, rows):
+        if any(params in self.conn.failing for params in rows):
+            raise RuntimeError("constraint violation")
+        self.conn.writes.append(("executemany" + ("/fast" if self.fast_executemany else ""), sql, rows))
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+        self.rollbacks = 0
+        self.commits = 0
+        self.executed: list[str] = []
+        self.writes: list[tuple] = []
+        self.failing: list[list] = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def commit(self):
+        self.commits += 1
+
+    def close(self):
+        self.closed = True
+
+
+def make_db_config(**kwargs):
+    return MssqlDatabaseConfig(
+        **{"type": "mssql", "server": "sql", "database": "db", "user": "u", "password": "p", **kwargs}
+    )
+
+
+class PooledConnection(DatabaseConnection):
+    opened: list[FakeConnection] = []
+
+    def _connect_mssql(self, db_name, db_config):
+        conn = FakeConnection()
+        self.opened.append(conn)
+        return conn
+
+
+def test_connections_are_reused_across_runs_and_replaced_when_dead():
+    PooledConnection.opened = []
+    pool = ConnectionPool()
+    configs = {"db": make_db_config()}
+
+    first = PooledConnection(configs, pool)
+    conn = first.get_connection("db")
+    first.close_connections()
+    second = PooledConnection(configs, pool)
+    reused = second.get_connection("db")
+    second.close_connections()
+    reused.alive = False
+    third = PooledConnection(configs, pool)
+    third.get_connection("db")
+
+    assert reused is conn and conn.rollbacks == 2
+    assert first.get_stats()["connects"] == 1
+    assert second.get_stats() == {"connects": 0, "reuses": 1, "connect_seconds": 0.0}
+    assert third.get_stats()["connects"] == 1 and conn.closed
+    assert third.get_connection("db") is PooledConnection.opened[-1]
+
+
+def test_idle_connections_expire_and_own_pool_closes_connections(monkeypatch):
+    PooledConnection.opened = []
+    pool = ConnectionPool()
+    configs = {"db": make_db_config(pool_max_idle_seconds=60)}
+    clock = [1000.0]
+    monkeypatch.setattr("api.database.time.monotonic", lambda: clock[0])
+
+    first = PooledConnection(configs, pool)
+    first.get_connection("db")
+    first.close_connections()
+    clock[0] += 61
+    second = PooledConnection(configs, pool)
+    second.get_connection("db")
+    standalone = PooledConnection(configs)
+    standalone.get_connection("db")
+    standalone.close_connections()
+
+    assert second.get_stats()["connects"] == 1
+    assert PooledConnection.opened[0].closed
+    assert PooledConnection.opened[-1].closed
+
+
+def test_time_zone_is_cached_per_connection_until_offset_changes_or_max_age(monkeypatch):
+    PooledConnection.opened = []
+    pool = ConnectionPool()
+    configs = {"db": make_db_config()}
+    local_offset = [timedelta(hours=1)]
+    monkeypatch.setattr("api.database.local_utc_offset", lambda: local_offset[0])
+    clock = [1000.0]
+    monkeypatch.setattr("api.database.time.monotonic", lambda: clock[0])
+
+    first = PooledConnection(configs, pool)
+    assert first.get_time_zone("db") == timedelta(minutes=1)
+    first.get_time_zone("db")
+    first.close_connections()
+    second = PooledConnection(configs, pool)
+    second.get_time_zone("db")
+    # Umstellung auf Sommerzeit
+    local_offset[0] = timedelta(hours=2)
+    second.get_time_zone("db")
+    # Umstellung nur auf dem Datenbankserver (Sync-Host in UTC): nach dem Höchstalter erneut abfragen
+    clock[0] += 3601
+    second.get_time_zone("db")
+
+    assert len(PooledConnection.opened) == 1
+    assert sum("TZOFFSET" in sql for sql in PooledConnection.opened[0].executed) == 3
+
+
+class ConcurrentConnection(DatabaseConnection):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.barrier = threading.Barrier(2, timeout=5)
+
+    def _connect_mssql(self, db_name, db_config):
+        # Wartet auf die zweite Verbindung: schlägt fehl, wenn nacheinander verbunden wird
+        self.barrier.wait()
+        if db_name == "offline":
+            raise DatabaseConnectionError(f"Fehler bei der Verbindung zur MSSQL-Datenbank '{db_name}'")
+        return FakeConnection()
+
+
+def test_connections_are_opened_lazily_in_parallel_and_fail_per_database():
+    configs = {"a": make_db_config(), "offline": make_db_config(database="offline"), "unused": make_db_config()}
+    database = ConcurrentConnection(configs, ConnectionPool())
+    assert database.connections == {}
+
+    database.connect(["a", "offline", "a"])
+
+    assert set(database.connections) == {"a"}
+    with pytest.raises(DatabaseConnectionError):
+        database.get_connection("offline")
+    with pytest.raises(DatabaseConnectionError):
+        database.get_connection("missing")
+    assert database.get_stats()["connects"] == 1
+
+
+def test_batch_writer_groups_statements_by_sql_and_keeps_order_per_key():
+    conn = FakeConnection()
+    writer = BatchWriter(conn, "db", batch_size=10, fast_executemany=True)
+
+    writer.add("INSERT INTO t (a) VALUES (?)", [1], "eingefügt")
+    writer.add("UPDATE t SET b = ? WHERE a = ?", ["x", 5], "aktualisiert", key=5)
+    writer.add("INSERT INTO t (a) VALUES (?)", [2], "eingefügt")
+    writer.add("UPDATE t SET c = ? WHERE a = ?", ["y", 5], "aktualisiert", key=5)
+    writer.flush()
+
+    assert conn.writes == [
+        ("executemany/fast", "INSERT INTO t (a) VALUES (?)", [[1], [2]]),
+        ("execute", "UPDATE t SET b = ? WHERE a = ?", ["x", 5]),
+        ("execute", "UPDATE t SET c = ? WHERE a = ?", ["y", 5]),
+    ]
+
+
+def test_batch_writer_replays_failed_batch_row_by_row():
+    conn = FakeConnection()
+    conn.failing = [[2]]
+    writer = BatchWriter(conn, "db", batch_size=3)
+
+    for value in [1, 2, 3]:
+        writer.add("INSERT INTO t (a) VALUES (?)", [value], "eingefügt")
+
+    assert conn.rollbacks == 2
+    assert conn.writes == [
+        ("execute", "INSERT INTO t (a) VALUES (?)", [1]),
+        ("execute", "INSERT INTO t (a) VALUES (?)", [3]),
+    ]
+
+
+def test_batch_writer_commits_per_policy_and_rolls_back_failed_block_to_savepoint():
+    conn = FakeConnection()
+    conn.failing = [[3]]
+    writer = BatchWriter(conn, "db", batch_size=2, dialect="firebird", commit_policy="batch", commit_every=4)
+
+    for value in [1, 2, 3, 4, 5]:
+        writer.add("INSERT INTO t (a) VALUES (?)", [value], "eingefügt")
+    assert conn.commits == 0 and writer.uncommitted == 3
+    writer.commit()
+
+    savepoint_sql = [write[1] for write in conn.writes if "SAVEPOINT" in write[1]]
+    assert conn.rollbacks == 0 and conn.commits == 1
+    assert (
+        savepoint_sql
+        == ["SAVEPOINT batch_writer", "ROLLBACK TO SAVEPOINT batch_writer"] * 2 + ["SAVEPOINT batch_writer"] * 2
+    )
+    assert [write[2] for write in conn.writes if write[0] == "execute" and "INSERT" in write[1]] == [[4], [5]]
@@ -0,0 +1,568 @@
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+import json
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from api.frappe import (
+    RETRY_STATUS_CODES,
+    FrappeAPI,
+    FrappeFetchError,
+    PageSizer,
+    RateLimiter,
+    format_page_sizes,
+    parse_retry_after,
+)
+from api.frappe_async import AsyncFrappeAPI
+from api.json_codec import CustomEncoder, OrjsonJsonCodec, StdlibJsonCodec, get_json_codec
+from config import FrappeConfig
+from utils.history_db import TaskHistoryDB
+
+
+class FakeResponse:
+    def __init__(self, payload: dict, status_code: int = 200, headers: dict | None = None):
+        self.payload = payload
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code}", response=self)
+
+    @property
+    def content(self):
+        return json.dumps(self.payload).encode()
+
+
+class FakeSession:
+    def __init__(self, responses: list[dict] | None = None):
+        self.responses = list(responses or [])
+        self.calls: list[tuple[str, str, dict]] = []
+
+    def request(self, method: str, endpoint: str, **kwargs):
+        self.calls.append((method, endpoint, kwargs))
+        response = self.responses.pop(0) if self.responses else {"data": []}
+        if isinstance(response, Exception):
+            raise response
+        return response if isinstance(response, FakeResponse) else FakeResponse(response)
+
+
+def make_config(**kwargs):
+    return FrappeConfig(api_key="key", api_secret="secret", url="http://frappe", **kwargs)
+
+
+def make_api(config: FrappeConfig | None = None, responses: list[dict] | None = None, dry_run: bool = False):
+    with patch.object(FrappeAPI, "get_time_zone_name", return_value=None):
+        api = FrappeAPI(config or make_config(), dry_run)
+    api.session.close()
+    api.session = FakeSession(responses)
+    return api
+
+
+def test_session_uses_pool_size_and_retry_config():
+    api = make_api(make_config(pool_size=7, max_retries=5, retry_backoff_factor=1.5))
+
+    session = api._create_session(api.config)
+    adapter = session.get_adapter("https://frappe")
+
+    assert adapter._pool_maxsize == 7
+    assert adapter.max_retries.total == 5
+    assert adapter.max_retries.backoff_factor == 1.5
+    assert set(adapter.max_retries.status_forcelist) == set(RETRY_STATUS_CODES)
+    session.close()
+
+
+def test_requests_go_through_session_with_timeouts():
+    api = make_api(make_config(connect_timeout_seconds=3, read_timeout_seconds=30), [{"data": {"name": "A"}}])
+
+    api.update_data("Contact", "A", {"email": "a@example.com", "modified": "2024-01-01"})
+
+    method, endpoint, kwargs = api.session.calls[0]
+    assert method == "PUT"
+    assert endpoint == "http://frappe/api/resource/Contact/A"
+    assert kwargs["timeout"] == (3, 30)
+    assert json.loads(kwargs["data"]) == {"email": "a@example.com"}
+    assert api.request_count == 1
+
+
+def test_iter_all_data_yields_page_by_page():
+    api = make_api(
+        make_config(limit_page_length=2, fetch_concurrency=1),
+        [{"data": [{"name": "A"}, {"name": "B"}]}, {"data": [{"name": "C"}]}],
+    )
+
+    records = api.iter_all_data("Contact")
+
+    assert next(records) == {"name": "A"}
+    assert len(api.session.calls) == 1
+    assert [rec["name"] for rec in records] == ["B", "C"]
+    assert [call[2]["params"]["limit_start"] for call in api.session.calls] == [0, 2]
+
+
+def test_get_all_data_raises_when_page_fails_at_minimum_size():
+    config = make_config(limit_page_length=1, max_page_length=1, fetch_concurrency=1)
+    api = make_api(config, [{"data": [{"name": "A"}]}, {}])
+
+    with pytest.raises(FrappeFetchError):
+        api.get_all_data("Contact")
+
+
+def test_keyset_pagination_continues_after_last_modified_and_name():
+    api = make_api(
+        make_config(limit_page_length=2),
+        [
+            {
+                "data": [
+                    {"name": "A", "modified": "2024-01-01 10:00:00"},
+                    {"name": "B", "modified": "2024-01-01 11:00:00"},
+                ]
+            },
+            {"data": [{"name": "C", "modified": "2024-01-01 11:00:00"}]},
+        ],
+    )
+
+    records = api.get_all_data("Contact", ['["modified", ">=", "2024-01-01"]'], or_filters=True, pagination="keyset")
+
+    assert [rec["name"] for rec in records["data"]] == ["A", "B", "C"]
+    first_params = api.session.calls[0][2]["params"]
+    second_params = api.session.calls[1][2]["params"]
+    assert "limit_start" not in first_params
+    assert first_params["order_by"] == "modified asc, name asc"
+    assert json.loads(second_params["filters"]) == [
+        ["modified", ">=", "2024-01-01"],
+        ["modified", ">=", "2024-01-01 11:00:00"],
+    ]
+    assert json.loads(second_params["or_filters"]) == [
+        ["modified", ">", "2024-01-01 11:00:00"],
+        ["name", ">", "B"],
+    ]
+
+
+def test_keyset_pagination_falls_back_to_offset_for_multiple_or_filters():
+    api = make_api(make_config(limit_page_length=2, fetch_concurrency=1), [{"data": [{"name": "A"}]}])
+
+    api.get_all_data("Contact", ['["a", "=", 1]', '["b", "=", 1]'], or_filters=True, pagination="keyset")
+
+    assert api.session.calls[0][2]["params"]["limit_start"] == 0
+
+
+class PagedSession(FakeSession):
+    """Beantwortet get_count und Seitenabrufe anhand der Parameter, unabhängig von der Reihenfolge."""
+
+    def __init__(self, records: list[dict]):
+        super().__init__()
+        self.records = records
+        self.lock = threading.Lock()
+
+    def request(self, method: str, endpoint: str, **kwargs):
+        with self.lock:
+            self.calls.append((method, endpoint, kwargs))
+        params = kwargs.get("params", {})
+        if endpoint.endswith("frappe.client.get_count"):
+            return FakeResponse({"message": len(self.records)})
+        start = params["limit_start"]
+        return FakeResponse({"data": self.records[start : start + params["limit"]]})
+
+
+def test_parallel_pages_are_reassembled_in_order():
+    records = [{"name": f"DOC-{i:03}"} for i in range(25)]
+    api = make_api(make_config(limit_page_length=4, fetch_concurrency=3))
+    api.session = PagedSession(records)
+
+    result = api.get_all_data("Contact")
+
+    assert result["data"] == records
+    assert api.session.calls[0][1] == "http://frappe/api/method/frappe.client.get_count"
+    assert len(api.session.calls) == 1 + 7
+
+
+def test_parallel_pages_load_records_added_after_count():
+    records = [{"name": f"DOC-{i}"} for i in range(4)]
+    api = make_api(make_config(limit_page_length=2, fetch_concurrency=2))
+    api.session = PagedSession(records)
+    original_request = api.session.request
+
+    def request_with_late_insert(method, endpoint, **kwargs):
+        response = original_request(method, endpoint, **kwargs)
+        if endpoint.endswith("get_count"):
+            records.append({"name": "DOC-late"})
+        return response
+
+    api.session.request = request_with_late_insert
+
+    result = api.get_all_data("Contact")
+
+    assert [rec["name"] for rec in result["data"]][-1] == "DOC-late"
+    assert len(result["data"]) == 5
+
+
+def test_parallel_pages_retry_failed_page():
+    records = [{"name": f"DOC-{i}"} for i in range(6)]
+    api = make_api(make_config(limit_page_length=2, min_page_length=1, fetch_concurrency=2))
+    api.session = PagedSession(records)
+    original_request = api.session.request
+    failures = [2]
+
+    def request_failing_once(method, endpoint, **kwargs):
+        if kwargs.get("params", {}).get("limit_start") in failures:
+            failures.remove(kwargs["params"]["limit_start"])
+            return FakeResponse({})
+        return original_request(method, endpoint, **kwargs)
+
+    api.session.request = request_failing_once
+
+    assert api.get_all_data("Contact")["data"] == records
+
+
+def test_parallel_pages_raise_when_retry_fails():
+    api = make_api(make_config(limit_page_length=2, min_page_length=2, fetch_concurrency=2))
+    api.session = PagedSession([{"name": f"DOC-{i}"} for i in range(6)])
+    original_request = api.session.request
+
+    def request_failing(method, endpoint, **kwargs):
+        if kwargs.get("params", {}).get("limit_start") == 2:
+            return FakeResponse({})
+        return original_request(method, endpoint, **kwargs)
+
+    api.session.request = request_failing
+
+    with pytest.raises(FrappeFetchError):
+        api.get_all_data("Contact")
+
+
+def test_fields_projection_is_sent_and_keyset_fields_are_added():
+    api = make_api(make_config(fetch_concurrency=1), [{"data": []}, {"data": []}])
+
+    api.get_all_data("Contact", fields=["email", "name"])
+    api.get_all_data("Contact", fields=["email"], pagination="keyset")
+
+    assert json.loads(api.session.calls[0][2]["params"]["fields"]) == ["email", "name"]
+    assert json.loads(api.session.calls[1][2]["params"]["fields"]) == ["email", "modified", "name"]
+
+
+def test_rows_are_decoded_from_compact_lists_and_dict_responses():
+    api = make_api(
+        make_config(fetch_concurrency=1, limit_page_length=2, max_page_length=2),
+        [{"data": [["A", "a@example.com"], ["B", None]]}, {"data": [{"email": "c@example.com", "name": "C"}]}],
+    )
+
+    rows = list(api.iter_all_rows("Contact", fields=["name", "email"]))
+
+    assert api.session.calls[0][2]["params"]["as_dict"] == 0
+    assert [row["name"] for row in rows] == ["A", "B", "C"]
+    assert rows[2]["email"] == "c@example.com"
+    assert rows[1].get("phone", "-") == "-"
+    assert "email" in rows[0] and "phone" not in rows[0]
+    assert rows[0].as_dict() == {"name": "A", "email": "a@example.com"}
+    assert type(rows[0]) is type(rows[2])
+
+
+def test_get_all_data_returns_dicts_for_compact_lists():
+    api = make_api(make_config(fetch_concurrency=1), [{"data": [["A", "a@example.com"]]}])
+
+    result = api.get_all_data("Contact", fields=["name", "email"])
+
+    assert result == {"data": [{"name": "A", "email": "a@example.com"}]}
+    assert type(result["data"][0]) is dict
+
+
+class FilterSession(FakeSession):
+    """Beantwortet `in`-Filter über GET-Parameter oder frappe.client.get_list-POST als kompakte Zeilen."""
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+
+    def request(self, method: str, endpoint: str, **kwargs):
+        with self.lock:
+            self.calls.append((method, endpoint, kwargs))
+        if method == "POST":
+            body = json.loads(kwargs["data"])
+            names = body["filters"][0][2]
+            return FakeResponse({"message": [[name] for name in names]})
+        names = json.loads(kwargs["params"]["filters"])[0][2]
+        return FakeResponse({"data": [[name] for name in names]})
+
+
+def test_rows_by_values_are_split_by_url_length_and_merged_in_order():
+    api = make_api(make_config(max_url_length=500, fetch_concurrency=3))
+    api.session = FilterSession()
+    names = [f"CONTACT-{i:05}" for i in range(100)]
+
+    rows = list(api.iter_rows_by_values("Contact", "name", names + names[:3], ["name"]))
+
+    assert [row["name"] for row in rows] == names
+    assert len(api.session.calls) > 1
+    for method, endpoint, kwargs in api.session.calls:
+        url = requests.Request(method, endpoint, params=kwargs["params"]).prepare().url
+        assert method == "GET" and len(url) <= 500
+
+
+def test_rows_by_values_post_values_that_do_not_fit_into_the_url():
+    api = make_api(make_config(max_url_length=500))
+    api.session = FilterSession()
+    long_name = "X" * 600
+
+    rows = list(api.iter_rows_by_values("Contact", "name", ["A", long_name, "B"], ["name"]))
+
+    assert [row["name"] for row in rows] == ["A", long_name, "B"]
+    assert [call[0] for call in api.session.calls] == ["GET", "POST", "GET"]
+    post = api.session.calls[1]
+    assert post[1] == "http://frappe/api/method/frappe.client.get_list"
+    assert json.loads(post[2]["data"])["fields"] == ["name"]
+
+
+def test_insert_many_sends_one_request_per_chunk():
+    api = make_api(make_config(write_batch_size=2), [{"message": ["A", "B"]}, {"data": {"name": "C"}}])
+
+    results = api.insert_many("Contact", [{"email": "a"}, {"email": "b", "modified": "x"}, {"email": "c"}])
+
+    # Ohne Schlüsselfelder lassen sich die Namen des Sammel-Inserts nicht zuordnen
+    assert results == [{"data": {}}, {"data": {}}, {"data": {"name": "C"}}]
+    method, endpoint, kwargs = api.session.calls[0]
+    assert endpoint == "http://frappe/api/method/frappe.client.insert_many"
+    docs = json.loads(json.loads(kwargs["data"])["docs"])
+    assert docs == [{"email": "a", "doctype": "Contact"}, {"email": "b", "doctype": "Contact"}]
+    assert api.session.calls[1][1] == "http://frappe/api/resource/Contact"
+
+
+def test_insert_many_matches_unordered_names_by_key_fields():
+    responses = [{"data": {"name": "X-1"}}, {"message": ["B-1", "A-1"]}, {"data": [["B-1", "b"], ["A-1", "a"]]}]
+    api = make_api(make_config(), responses)
+    key_fn = lambda doc: (doc["email"],) if "email" in doc else None
+
+    results = api.insert_many("Contact", [{"email": "a"}, {"phone": "1"}, {"email": "b"}], ["email"], key_fn)
+
+    assert results == [{"data": {"name": "A-1"}}, {"data": {"name": "X-1"}}, {"data": {"name": "B-1"}}]
+    # Dokument ohne Schlüssel einzeln, die Namen des Sammel-Inserts werden mit den Schlüsselfeldern nachgelesen
+    assert [call[1] for call in api.session.calls] == [
+        "http://frappe/api/resource/Contact",
+        "http://frappe/api/method/frappe.client.insert_many",
+        "http://frappe/api/resource/Contact",
+    ]
+    assert json.loads(api.session.calls[2][2]["params"]["fields"]) == ["name", "email"]
+
+
+def test_insert_many_falls_back_to_single_inserts_on_rejection():
+    rejected = FakeResponse({}, status_code=417)
+    api = make_api(make_config(), [rejected, {"data": {"name": "A"}}, {}])
+
+    results = api.insert_many("Contact", [{"email": "a"}, {"email": "b"}])
+
+    assert results == [{"data": {"name": "A"}}, {}]
+    assert [call[1] for call in api.session.calls[1:]] == ["http://frappe/api/resource/Contact"] * 2
+
+
+def test_insert_many_does_not_resend_chunk_after_timeout():
+    api = make_api(make_config(), [requests.exceptions.ReadTimeout("timeout")])
+
+    results = api.insert_many("Contact", [{"email": "a"}, {"email": "b"}])
+
+    assert results == [None, None]
+    assert len(api.session.calls) == 1
+
+
+def test_update_many_reports_failed_documents():
+    failed = {"doc": {"docname": "B"}, "exc": "Traceback\nValidationError: kaputt"}
+    api = make_api(make_config(), [{"message": {"failed_docs": [failed]}}])
+
+    results = api.update_many("Contact", [("A", {"email": "a"}), ("B", {"email": "b"})])
+
+    assert results == [{"data": {"name": "A"}}, None]
+    docs = json.loads(json.loads(api.session.calls[0][2]["data"])["docs"])
+    assert docs[0] == {"email": "a", "doctype": "Contact", "docname": "A"}
+
+
+def test_bulk_writes_log_each_document_in_dry_run():
+    api = make_api(make_config(), dry_run=True)
+
+    results = api.insert_many("Contact", [{"email": "a"}, {"email": "b"}])
+
+    assert results == [{"data": {}}, {"data": {}}]
+    assert api.session.calls == []
+
+
+class SlowFrappe:
+    def __init__(self, config: FrappeConfig, dry_run: bool = False):
+        self.config = config
+        self.dry_run = dry_run
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.calls: list[tuple[str, str]] = []
+
+    def _track(self, doc_name: str, value: str, delay: float):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(delay)
+        with self.lock:
+            self.active -= 1
+            self.calls.append((doc_name, value))
+        return {"data": {"name": doc_name}}
+
+    def update_data(self, doc_type, doc_name, data):
+        return self._track(doc_name, data["value"], data.get("delay", 0.01))
+
+
+def run_updates(api: SlowFrappe, updates: list[tuple[str, dict]]):
+    async def run():
+        client = AsyncFrappeAPI(api)
+        return await asyncio.gather(*(client.update_data("Contact", name, data) for name, data in updates))
+
+    return asyncio.run(run())
+
+
+def test_async_writes_are_bounded_and_ordered_per_document():
+    api = SlowFrappe(make_config(write_concurrency=3))
+    updates = [("A", {"value": "a1", "delay": 0.05}), ("A", {"value": "a2"})]
+    updates += [(f"DOC-{i}", {"value": str(i)}) for i in range(8)]
+
+    results = run_updates(api, updates)
+
+    assert [res["data"]["name"] for res in results] == [name for name, _ in updates]
+    assert api.max_active == 3
+    assert [value for name, value in api.calls if name == "A"] == ["a1", "a2"]
+
+
+def test_async_writes_run_sequentially_in_dry_run():
+    api = SlowFrappe(make_config(write_concurrency=3), dry_run=True)
+    updates = [(f"DOC-{i}", {"value": str(i)}) for i in range(4)]
+
+    run_updates(api, updates)
+
+    assert api.max_active == 1
+    assert [value for _, value in api.calls] == ["0", "1", "2", "3"]
+
+
+def test_page_sizer_grows_on_fast_and_shrinks_on_slow_responses():
+    sizer = PageSizer(make_config(limit_page_length=50, min_page_length=20, max_page_length=150))
+
+    sizer.record(50, 0.1, True)
+    assert sizer.current == 100
+    sizer.record(100, 0.1, True)
+    assert sizer.current == 150
+    sizer.record(150, 1.5, True)
+    assert sizer.current == 150
+    sizer.record(150, 5, True)
+    assert sizer.current == 75
+    sizer.record(75, 0.1, False)
+    assert sizer.current == 37
+    assert format_page_sizes([50, 100, 150, 150, 75]) == "50, 100, 150 x2, 75"
+
+
+def test_offset_paging_retries_failed_page_with_smaller_size():
+    config = make_config(limit_page_length=40, min_page_length=10, max_page_length=40, fetch_concurrency=1)
+    api = make_api(config, [{}, {"data": [{"name": "A"}]}])
+
+    assert api.get_all_data("Contact") == {"data": [{"name": "A"}]}
+    assert [call[2]["params"]["limit"] for call in api.session.calls] == [40, 20]
+    assert api.page_sizer.history == [40, 20]
+
+
+def fake_clock(monkeypatch):
+    clock = [100.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+
+    monkeypatch.setattr("api.frappe.time.monotonic", lambda: clock[0])
+    monkeypatch.setattr("api.frappe.time.sleep", sleep)
+    return sleeps
+
+
+def test_throttled_post_is_retried_after_retry_after(monkeypatch):
+    sleeps = fake_clock(monkeypatch)
+    throttled = FakeResponse({}, status_code=429, headers={"Retry-After": "2"})
+    api = make_api(make_config(), [throttled, {"data": {"name": "A"}}])
+
+    assert api.insert_data("Contact", {"email": "a"}) == {"data": {"name": "A"}}
+    assert [call[0] for call in api.session.calls] == ["POST", "POST"]
+    assert sleeps == [2]
+    assert api.rate_limiter.wait_seconds == 2
+
+
+def test_rate_limiter_waits_when_burst_is_used_up(monkeypatch):
+    sleeps = fake_clock(monkeypatch)
+    limiter = RateLimiter(rate=2, burst=2)
+
+    for _ in range(3):
+        limiter.acquire()
+
+    assert sleeps == [0.5]
+    assert limiter.wait_seconds == 0.5
+
+
+def test_parse_retry_after_accepts_seconds_and_http_dates():
+    assert parse_retry_after("3") == 3
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert parse_retry_after("kaputt") is None
+    assert parse_retry_after(None) is None
+
+
+def test_json_codecs_encode_like_custom_encoder():
+    payload = {
+        "naive": datetime(2024, 1, 1, 8, 0, 0, 5),
+        "aware": datetime(2024, 6, 1, 12, 0, tzinfo=timezone(timedelta(hours=2))),
+        "day": date(2024, 2, 29),
+        "amount": Decimal("12.50"),
+        "name": "Müller",
+        1: [None, True, 1.5],
+    }
+    expected = json.loads(json.dumps(payload, cls=CustomEncoder))
+
+    assert StdlibJsonCodec().dumps(payload) == json.dumps(payload, cls=CustomEncoder).encode()
+    assert json.loads(OrjsonJsonCodec().dumps(payload)) == expected
+    assert OrjsonJsonCodec().loads(b'{"data": [["A", 1]]}') == {"data": [["A", 1]]}
+
+
+def test_json_codec_falls_back_to_stdlib(monkeypatch):
+    monkeypatch.setattr("api.json_codec.orjson", None)
+
+    assert get_json_codec("auto").name == "stdlib"
+    assert get_json_codec("orjson").name == "stdlib"
+
+
+class HtmlResponse(FakeResponse):
+    content = b"<html>Bad Gateway</html>"
+
+
+def test_invalid_json_response_is_reported_as_request_error():
+    api = make_api(make_config(), [HtmlResponse({})])
+
+    assert api.get_data("Contact") is None
+
+
+def test_time_zone_and_doctype_fields_are_cached_in_history_db(tmp_path):
+    config = make_config(fetch_concurrency=1)
+    responses = [
+        {"docs": [{"name": "Contact", "fields": [{"fieldname": "email", "fieldtype": "Data"}]}]},
+        {"data": [["A", "a@example.com"]]},
+    ]
+    with TaskHistoryDB(str(tmp_path / "history.db")) as history_db:
+        history_db.save_metadata("http://frappe|time_zone", "Europe/Berlin")
+        with patch.object(FrappeAPI, "_fetch_time_zone_name") as fetch_time_zone:
+            first = FrappeAPI(config, False, metadata_cache=history_db)
+        first.session.close()
+        first.session = FakeSession(responses)
+        rows = list(first.iter_all_rows("Contact", fields=["name", "email", "removed_field"]))
+
+        second = make_api(config)
+        second.metadata_cache = history_db
+        fields = second._known_fields("Contact", ["name", "removed_field"])
+
+        assert history_db.clear_metadata() == 2
+
+    fetch_time_zone.assert_not_called()
+    assert first.tz_delta is not None
+    assert [row["email"] for row in rows] == ["a@example.com"]
+    assert json.loads(first.session.calls[-1][2]["params"]["fields"]) == ["name", "email"]
+    assert fields == ["name"]
+    assert second.session.calls == []
@@ -1,11 +1,23 @@
 import logging
 from datetime import datetime, timedelta
 
-from config import DbToFrappeTaskConfig, TaskDbBase, TaskFrappeBase
+from api.database import BatchWriter, escape_identifier_mssql
+from config import (
+    BidirectionalTaskConfig,
+    DbToFrappeTaskConfig,
+    FrappeConfig,
+    FrappeToDbTaskConfig,
+    TaskDbBase,
+    TaskDbFrappeToDb,
+    TaskFrappeBase,
+)
 from sync.bidirectional import compare_datetimes
+from sync.db_to_frappe import DbToFrappeSyncTask
+from sync.frappe_to_db import FrappeToDbSyncTask
 from sync.manager import SyncManager, gen_task_hash
-from sync.task import SyncTaskBase
+from sync.task import SyncTaskBase, normalize_key_value
 from utils.history_db import SQLiteRunLogHandler, TaskHistoryDB, SyncState
+from utils.rows import row_type
 
 
 class DummyTask(SyncTaskBase[DbToFrappeTaskConfig]):
@@ -57,6 +69,459 @@ def test_timezone_harmonization_frappe_to_db():
     assert result["updated_at"] == datetime(2024, 1, 1, 11, 0)
 
 
+def test_cast_frappe_record_returns_new_record():
+    config = make_config({"modified": "updated_at", "count": "count_db"}, frappe_int_fields=["count"])
+    config.frappe.datetime_fields = ["modified"]
+    task = make_task(config)
+    row = row_type(("modified", "count"))
+    record = row.from_values(("2024-01-01 10:00:00", "7"))
+
+    casted = task._cast_frappe_record(record)
+
+    assert casted == {"modified": datetime(2024, 1, 1, 10, 0), "count": 7}
+    assert isinstance(casted, row)
+    assert record["count"] == "7"
+    assert task._cast_frappe_record({"count": ""}) == {"count": None}
+
+
+class RecordingFrappe:
+    def __init__(self, existing: list[dict] | None = None, write_batch_size=100):
+        self.config = FrappeConfig(api_key="k", api_secret="s", url="http://frappe", write_batch_size=write_batch_size)
+        self.tz_delta = None
+        self.dry_run = False
+        self.existing = existing or []
+        self.inserted: list[list[dict]] = []
+        self.lookups: list[list[str]] = []
+        self.value_lookups: list[list] = []
+        self.updated: list[tuple[str, dict]] = []
+        self.scans = 0
+
+    def get_data(self, doc_type, filters=[], **kwargs):
+        self.lookups.append(filters)
+        return {"data": []}
+
+    def get_count(self, doc_type, filters=[]):
+        return len(self.existing)
+
+    def iter_rows_by_values(self, doc_type, field, values, fields, filters=[]):
+        self.value_lookups.append(values)
+        # Vergleich wie in MariaDB: ohne Groß-/Kleinschreibung und Leerzeichen am Ende
+        wanted = {normalize_key_value(value) for value in values}
+        row = row_type(tuple(fields))
+        return [row.from_dict(doc) for doc in self.existing if normalize_key_value(doc.get(field)) in wanted]
+
+    def iter_all_rows(self, doc_type, filters=[], params=None, or_filters=False, pagination="offset", fields=[]):
+        self.scans += 1
+        row = row_type(tuple(fields))
+        return [row.from_dict(doc) for doc in self.existing]
+
+    def insert_many(self, doc_type, docs, key_fields=None, key_fn=None):
+        self.inserted.append([{**doc, "name": f"DOC-{len(self.inserted)}"} for doc in docs])
+        return [{"data": {"name": f"DOC-{len(self.inserted)}"}} for _ in docs]
+
+    def update_many(self, doc_type, updates):
+        self.updated.extend(updates)
+        return [{"data": {"name": name}} for name, _ in updates]
+
+    def delete_many(self, doc_type, doc_names):
+        return []
+
+
+def make_db_to_frappe_task(frappe: RecordingFrappe, db_records: list[dict]):
+    task = DbToFrappeSyncTask.__new__(DbToFrappeSyncTask)
+    task.config = make_config({"modified": "updated_at"})
+    task.frappe_api = frappe
+    task.frappe_tz_delta = timedelta()
+    task.db_tz_delta = timedelta()
+    task._frappe_inserts, task._frappe_updates, task._frappe_deletes = [], [], []
+    task.db_writer = None
+    task._manual_id_inserts = []
+    task.iter_db_records = lambda last_sync_date_utc=None: iter(db_records)
+    return task
+
+
+def test_db_to_frappe_flushes_pending_insert_before_duplicate_key_lookup():
+    task = make_db_to_frappe_task(RecordingFrappe(), [{"updated_at": "2024-01-01"}, {"updated_at": "2024-01-01"}])
+
+    task.sync()
+
+    assert len(task.frappe_api.inserted) == 1
+    assert len(task.frappe_api.inserted[0]) == 1
+    assert task.frappe_api.updated == [("DOC-1", {})]
+
+
+def test_db_to_frappe_resolves_existing_documents_from_key_index():
+    existing = [{"name": f"DOC-{i}", "modified": f"KEY-{i}"} for i in range(10)]
+    frappe = RecordingFrappe(existing)
+    task = make_db_to_frappe_task(frappe, [{"updated_at": "key-3  "}, {"updated_at": "KEY-42"}])
+
+    task.sync()
+
+    assert frappe.lookups == []
+    assert frappe.value_lookups == [["key-3  ", "KEY-42"]]
+    assert frappe.updated == [("DOC-3", {})]
+    assert [doc["modified"] for doc in frappe.inserted[0]] == ["KEY-42"]
+
+
+def test_db_to_frappe_maps_only_key_fields_before_sending():
+    frappe = RecordingFrappe([{"name": "DOC-1", "modified": "KEY-1"}])
+    task = make_db_to_frappe_task(frappe, [{"updated_at": "KEY-1", "mail": "a"}, {"updated_at": "KEY-2", "mail": "b"}])
+    task.config.mapping["email"] = "mail"
+    mapped: list[dict] = []
+    map_db_to_frappe = task.map_db_to_frappe
+    task.map_db_to_frappe = lambda record, warns=True: mapped.append(dict(record)) or map_db_to_frappe(record, warns)
+
+    task.sync()
+
+    # Vollständig gemappt wird nur beim Senden, für Index und Abgleich reichen die Schlüsselfelder
+    assert sorted(record["mail"] for record in mapped if "mail" in record) == ["a", "b"]
+    assert frappe.inserted[0][0]["email"] == "b"
+
+
+def test_db_to_frappe_streams_db_rows_in_blocks():
+    existing = [{"name": f"DOC-{i}", "modified": f"KEY-{i}"} for i in range(10)]
+    frappe = RecordingFrappe(existing)
+    task = make_db_to_frappe_task(frappe, [])
+    task.config.db.batch_size = 2
+    consumed: list[int] = []
+
+    def iter_db_records(last_sync_date_utc=None):
+        for i in range(3):
+            consumed.append(i)
+            yield {"updated_at": f"KEY-{i}"}
+
+    task.iter_db_records = iter_db_records
+    iter_rows_by_values = frappe.iter_rows_by_values
+    frappe.iter_rows_by_values = lambda *args: (consumed.append("lookup"), iter_rows_by_values(*args))[1]
+
+    task.sync()
+
+    # Der erste Block wird abgeglichen, bevor die übrigen Zeilen gelesen werden
+    assert consumed == [0, 1, "lookup", 2, "lookup"]
+    assert frappe.updated == [("DOC-0", {}), ("DOC-1", {}), ("DOC-2", {})]
+
+
+def test_db_to_frappe_scans_keys_when_most_documents_are_needed():
+    frappe = RecordingFrappe([{"name": "DOC-1", "modified": "KEY-1"}])
+    task = make_db_to_frappe_task(frappe, [{"updated_at": "KEY-1"}, {"updated_at": "KEY-2"}])
+
+    task.sync()
+
+    assert frappe.scans == 1 and frappe.value_lookups == []
+    assert frappe.updated == [("DOC-1", {})]
+
+
+class RecordingDbCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        self.conn.queries.append((sql, list(params or [])))
+        for fragment, error in self.conn.errors.items():
+            if fragment in sql:
+                raise error
+
+    def executemany(self, sql, seq_of_params):
+        self.conn.queries.append((sql, [list(params) for params in seq_of_params]))
+
+    @property
+    def description(self):
+        return [(column,) for column in self.conn.columns]
+
+    def fetchall(self):
+        return self.conn.rows.pop(0) if self.conn.rows else []
+
+    def fetchone(self):
+        rows = self.fetchall()
+        return rows[0] if rows else None
+
+    def fetchmany(self, size):
+        self.conn.fetch_sizes.append(size)
+        return self.fetchall()
+
+    def close(self):
+        pass
+
+
+class RecordingDbConnection:
+    def __init__(self, rows: list[list[tuple]] | None = None, columns: list[str] | None = None):
+        self.rows = list(rows or [])
+        self.columns = columns or []
+        self.fetch_sizes: list[int] = []
+        self.queries: list[tuple[str, list]] = []
+        self.commits = 0
+        self.errors: dict[str, Exception] = {}
+
+    def cursor(self):
+        return RecordingDbCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+def make_frappe_to_db_task(mapping: dict, key_fields: list[str], dialect="mssql", db_conn=None, batch_size=500):
+    task = FrappeToDbSyncTask.__new__(FrappeToDbSyncTask)
+    task.config = FrappeToDbTaskConfig(
+        direction="frappe_to_db",
+        doc_type="Employee",
+        db_name="db",
+        mapping=mapping,
+        key_fields=key_fields,
+        table_name="employees",
+        frappe=TaskFrappeBase(),
+        db=TaskDbFrappeToDb(modified_fields=["changed"], id_field="id", batch_size=batch_size),
+    )
+    task.db_conn = db_conn or RecordingDbConnection()
+    task.db_dialect = dialect
+    task.esc_db_col = lambda x: x
+    task.frappe_tz_delta = timedelta()
+    task.db_tz_delta = timedelta()
+    task.inserted, task.updated = [], []
+    task.db_writer = None
+    task._manual_id_inserts = []
+    task.queue_db_insert = task.inserted.append
+    task.update_db_record = task.updated.append
+    return task
+
+
+def make_merge_task(dialect: str, db_conn: RecordingDbConnection):
+    task = make_frappe_to_db_task({"employee": "emp_no", "name1": "name"}, ["employee"], dialect, db_conn)
+    task.config.upsert = "merge"
+    task.dry_run = False
+    task.db_writer = BatchWriter(db_conn, "db", 500, dialect=dialect)
+    return task
+
+
+def test_merge_upsert_uses_staging_table_and_output_on_mssql():
+    db_conn = RecordingDbConnection([[("UPDATE", "1", "Eins", None, None), ("INSERT", "2", "Zwei", None, 7)]])
+    db_conn.columns = ["merge_action", "emp_no", "name", "changed", "id"]
+    task = make_merge_task("mssql", db_conn)
+    records = [
+        {"employee": "1", "name1": "Alt"},
+        {"employee": "2", "name1": "Zwei"},
+        {"employee": "1", "name1": "Eins"},
+    ]
+
+    task.sync_batch(records)
+
+    assert [sql for sql, _ in db_conn.queries] == [
+        "IF OBJECT_ID('tempdb..#frappe_staging') IS NOT NULL DROP TABLE #frappe_staging",
+        "SELECT TOP 0 emp_no, name INTO #frappe_staging FROM employees "
+        "UNION ALL SELECT TOP 0 emp_no, name FROM employees",
+        "INSERT INTO #frappe_staging (emp_no, name) VALUES (?, ?)",
+        "MERGE employees WITH (HOLDLOCK) AS t USING #frappe_staging AS s ON t.emp_no = s.emp_no"
+        " WHEN MATCHED THEN UPDATE SET t.name = s.name"
+        " WHEN NOT MATCHED BY TARGET THEN INSERT (emp_no, name) VALUES (s.emp_no, s.name)"
+        " OUTPUT $action AS merge_action, inserted.emp_no, inserted.name, inserted.changed, inserted.id;",
+        "DROP TABLE #frappe_staging",
+    ]
+    # Doppelter Schlüssel im Block: der letzte Datensatz gewinnt
+    assert db_conn.queries[2][1] == [["2", "Zwei"], ["1", "Eins"]]
+    assert db_conn.commits == 1
+    assert task.inserted == [] and task.updated == []
+
+
+def make_manual_id_task(dialect: str, db_conn: RecordingDbConnection, id_max: int | None = None):
+    task = make_frappe_to_db_task({"employee": "emp_no"}, ["employee"], dialect, db_conn)
+    task.config.db.manual_id_sequence = True
+    task.config.db.manual_id_sequence_max = id_max
+    task.dry_run = False
+    task.db_writer = BatchWriter(db_conn, "db", 500, dialect=dialect)
+    del task.queue_db_insert
+    return task
+
+
+def test_manual_id_sequence_reserves_ids_for_whole_batch():
+    db_conn = RecordingDbConnection([[], [(41,)]])
+    task = make_manual_id_task("mssql", db_conn, id_max=1000)
+
+    task.sync_batch([{"employee": "1"}, {"employee": "2"}])
+
+    assert db_conn.queries[1:] == [
+        ("SELECT COALESCE(MAX(id), 0) FROM employees WITH (TABLOCKX, HOLDLOCK) WHERE id < ?", [1000]),
+        ("INSERT INTO employees (emp_no, id) VALUES (?, ?);", [["1", 42], ["2", 43]]),
+    ]
+    assert db_conn.commits == 1
+
+
+def test_manual_id_sequence_on_firebird_has_no_table_hint_and_respects_max():
+    db_conn = RecordingDbConnection([[], [(9,)], [(9,)], [(10,)]])
+    task = make_manual_id_task("firebird", db_conn, id_max=11)
+
+    task.sync_batch([{"employee": "1"}, {"employee": "2"}])
+
+    # Der Block übersteigt manual_id_sequence_max und wird einzeln wiederholt
+    assert db_conn.queries[1:] == [
+        ("SELECT COALESCE(MAX(id), 0) FROM employees WHERE id < ?", [11]),
+        ("SELECT COALESCE(MAX(id), 0) FROM employees WHERE id < ?", [11]),
+        ("INSERT INTO employees (emp_no, id) VALUES (?, ?);", [["1", 10]]),
+        ("SELECT COALESCE(MAX(id), 0) FROM employees WHERE id < ?", [11]),
+    ]
+    assert db_conn.commits == 1
+
+
+def test_insert_returns_written_row_via_output_or_returning():
+    expected = {
+        "mssql": "INSERT INTO employees (emp_no) OUTPUT INSERTED.emp_no, INSERTED.changed, INSERTED.id VALUES (?);",
+        "firebird": "INSERT INTO employees (emp_no) VALUES (?) RETURNING emp_no, changed, id;",
+    }
+    for dialect, sql in expected.items():
+        db_conn = RecordingDbConnection([[("1", None, 5)]], ["emp_no", "changed", "id"])
+        task = make_frappe_to_db_task({"employee": "emp_no"}, ["employee"], dialect, db_conn)
+        task.dry_run = False
+        task.db_writer = BatchWriter(db_conn, "db", 500, dialect=dialect)
+
+        created = task.insert_frappe_record_to_db({"employee": "1"})
+
+        assert db_conn.queries == [(sql, ["1"])]
+        assert created["id"] == 5
+        assert db_conn.commits == 1
+
+
+def test_batch_insert_with_manual_ids_reserves_one_block_and_returns_rows():
+    db_conn = RecordingDbConnection([[(41,)], [("1", None, 42)], [("2", None, 43)]], ["emp_no", "changed", "id"])
+    task = make_manual_id_task("mssql", db_conn)
+
+    created = task.insert_frappe_records_to_db([{"employee": "1"}, {"employee": "2"}])
+
+    assert [row["id"] for row in created] == [42, 43]
+    assert [sql for sql, _ in db_conn.queries] == [
+        "SELECT COALESCE(MAX(id), 0) FROM employees WITH (TABLOCKX, HOLDLOCK)",
+        "INSERT INTO employees (emp_no, id) OUTPUT INSERTED.emp_no, INSERTED.changed, INSERTED.id VALUES (?, ?);",
+        "INSERT INTO employees (emp_no, id) OUTPUT INSERTED.emp_no, INSERTED.changed, INSERTED.id VALUES (?, ?);",
+    ]
+    assert db_conn.commits == 1
+
+
+def test_insert_falls_back_to_reselect_when_table_rejects_output():
+    db_conn = RecordingDbConnection([[("1", None, 5)], [], [("2", None, 6)], []], ["emp_no", "changed", "id"])
+    db_conn.errors["OUTPUT"] = RuntimeError(
+        "[SQL Server]The target table 'employees' of the DML statement cannot have any enabled triggers if the "
+        "statement contains an OUTPUT clause without INTO clause. (334)"
+    )
+    task = make_frappe_to_db_task({"employee": "emp_no"}, ["employee"], "mssql", db_conn)
+    task.dry_run = False
+    task.db_writer = BatchWriter(db_conn, "db", 500)
+
+    created = task.insert_frappe_records_to_db([{"employee": "1"}, {"employee": "2"}])
+
+    assert [row["id"] for row in created] == [5, 6]
+    assert [sql for sql, _ in db_conn.queries][1:] == [
+        "INSERT INTO employees (emp_no) VALUES (?);",
+        "SELECT emp_no, changed, id FROM employees WHERE emp_no = ?",
+        "SELECT emp_no, changed, id FROM employees WHERE emp_no = ?",
+    ]
+    assert db_conn.queries[1][1] == [["1"], ["2"]]
+
+
+def test_insert_falls_back_to_reselect_without_returning():
+    db_conn = RecordingDbConnection([[("1", None, 5)]], ["emp_no", "changed", "id"])
+    task = make_frappe_to_db_task({"employee": "emp_no"}, ["employee"], "mssql", db_conn)
+    task.config.db.returning = False
+    task.dry_run = False
+    task.db_writer = BatchWriter(db_conn, "db", 500)
+
+    created = task.insert_frappe_record_to_db({"employee": "1"})
+
+    assert db_conn.queries == [
+        ("INSERT INTO employees (emp_no) VALUES (?);", ["1"]),
+        ("SELECT emp_no, changed, id FROM employees WHERE emp_no = ?", ["1"]),
+    ]
+    assert created["id"] == 5
+
+
+def test_failed_run_still_writes_queued_statements_unless_commit_policy_is_run():
+    for policy, expected_queries in [("statement", 1), ("batch", 1), ("run", 0)]:
+        db_conn = RecordingDbConnection()
+        task = make_frappe_to_db_task({"employee": "emp_no"}, ["employee"], db_conn=db_conn)
+        task.dry_run = False
+        task.db_writer = BatchWriter(db_conn, "db", 500, commit_policy=policy)
+        task.queue_db_write("UPDATE employees SET fk = ? WHERE id = ?", ["DOC-1", 1], "ok")
+
+        task.rollback_db_writes()
+
+        assert len(db_conn.queries) == expected_queries
+        assert db_conn.commits == expected_queries
+
+
+def test_db_writes_queued_for_inserted_frappe_documents_are_flushed_immediately():
+    db_conn = RecordingDbConnection()
+    task = make_db_to_frappe_task(RecordingFrappe(), [{"updated_at": "KEY-1"}])
+    task.db_writer = BatchWriter(db_conn, "db", 500)
+    task.on_frappe_record_inserted = lambda db_rec, doc: task.queue_db_write("UPDATE t SET fk = ?", [doc["name"]], "ok")
+
+    task.sync()
+
+    assert db_conn.queries == [("UPDATE t SET fk = ?", ["DOC-1"])]
+    assert db_conn.commits == 1
+
+
+def test_merge_upsert_uses_update_or_insert_on_firebird_and_skips_incomplete_keys():
+    db_conn = RecordingDbConnection()
+    task = make_merge_task("firebird", db_conn)
+    records = [{"employee": "1", "name1": "Eins"}, {"employee": "2", "name1": "Zwei"}, {"name1": "ohne Schlüssel"}]
+
+    task.sync_batch(records)
+
+    assert db_conn.queries[0] == (
+        "UPDATE OR INSERT INTO employees (emp_no, name) VALUES (?, ?) MATCHING (emp_no)",
+        [["1", "Eins"], ["2", "Zwei"]],
+    )
+    # Ohne vollständigen Schlüssel wie bisher über Existenzprüfung und Insert
+    assert task.inserted == [{"name1": "ohne Schlüssel"}]
+
+
+def test_frappe_to_db_checks_existing_keys_once_per_batch():
+    db_conn = RecordingDbConnection([[("2 ",)], []])
+    task = make_frappe_to_db_task({"employee": "emp_no"}, ["employee"], db_conn=db_conn, batch_size=3)
+    records = [{"employee": key} for key in ["1", "2", "1", "3"]]
+    task.iter_frappe_records = lambda last_sync_date_utc=None: iter(records)
+
+    task.sync()
+
+    assert db_conn.queries == [
+        ("SELECT t.emp_no FROM employees t WHERE t.emp_no IN (?, ?, ?)", ["1", "2", "1"]),
+        ("SELECT t.emp_no FROM employees t WHERE t.emp_no IN (?)", ["3"]),
+    ]
+    assert task.inserted == [{"employee": "1"}, {"employee": "3"}]
+    assert task.updated == [{"employee": "2"}, {"employee": "1"}]
+
+
+def test_existing_keys_for_composite_keys_use_values_join_or_conditions():
+    mapping = {"company": "firma", "employee": "emp_no"}
+    keys = [{"firma": "A", "emp_no": 1}, {"firma": "B", "emp_no": 2}]
+    mssql = make_frappe_to_db_task(mapping, ["company", "employee"], db_conn=RecordingDbConnection([[("a", 1)]]))
+    firebird = make_frappe_to_db_task(mapping, ["company", "employee"], dialect="firebird")
+
+    existing = mssql.get_existing_db_keys(keys)
+    firebird.get_existing_db_keys(keys)
+
+    assert existing == {("a", "1")}
+    assert mssql.db_conn.queries[0][0] == (
+        "SELECT t.firma, t.emp_no FROM employees t JOIN (VALUES (?, ?), (?, ?)) AS v(k0, k1) "
+        "ON t.firma = v.k0 AND t.emp_no = v.k1"
+    )
+    assert firebird.db_conn.queries[0] == (
+        "SELECT t.firma, t.emp_no FROM employees t WHERE (t.firma = ? AND t.emp_no = ?) OR (t.firma = ? AND t.emp_no = ?)",
+        ["A", 1, "B", 2],
+    )
+
+
+def test_db_reads_are_streamed_as_compact_rows():
+    db_conn = RecordingDbConnection([[(1, "A"), (2, "B")], [(3, "C")]], columns=["ID", "NAME"])
+    task = make_frappe_to_db_task({"employee": "ID"}, ["employee"], db_conn=db_conn)
+
+    rows = list(task.iter_select_query("SELECT ID, NAME FROM employees"))
+
+    assert db_conn.fetch_sizes == [1000, 1000, 1000]
+    assert [row["NAME"] for row in rows] == ["A", "B", "C"]
+    assert type(rows[0]) is type(rows[2])
+    assert rows[0].as_dict() == {"ID": 1, "NAME": "A"} and rows[0].get("missing") is None
+
+
 def test_value_mapping_strict_skips_unknown_values():
     config = make_config(
         {"modified": "updated_at", "status": "status_db"},
@@ -104,6 +569,15 @@ def test_save_sync_date_replaces_entries_with_same_hash(tmp_path):
     manager.history_db.close()
 
 
+def test_task_hash_ignores_pagination_setting():
+    config = make_config({"modified": "updated_at"})
+    task_hash = gen_task_hash(config)
+
+    config.frappe.pagination = "keyset"
+
+    assert gen_task_hash(config) == task_hash
+
+
 def test_timezone_harmonization_db_to_frappe():
     config = make_config({"modified": "updated_at"})
     task = make_task(config, frappe_delta=timedelta(hours=2), db_delta=timedelta(hours=1))
@@ -140,6 +614,33 @@ def test_cast_frappe_record_parses_datetime_and_int():
     assert parsed["other"] == "keep"
 
 
+def test_frappe_fields_projection_contains_only_needed_fields():
+    config = BidirectionalTaskConfig(
+        direction="bidirectional",
+        doc_type="Contact",
+        db_name="db",
+        mapping={"db_id": "ContactID", "email": "Email", "modified": "Aenderung"},
+        key_fields=["db_id"],
+        table_name="Contact",
+        frappe={"modified_fields": ["modified", "custom_modified"], "fk_id_field": "db_id"},
+        db={"modified_fields": ["Aenderung"], "fk_id_field": "fk", "id_field": "ContactID"},
+    )
+    task = make_task(config)
+
+    assert task.get_frappe_fields() == ["db_id", "email", "modified", "custom_modified", "name"]
+
+
+def test_db_reads_select_only_mapped_and_sync_columns():
+    mapping = {"employee": "PersNr", "first_name": "Vorname", "order": "Order"}
+    db_conn = RecordingDbConnection(columns=["PersNr"])
+    task = make_frappe_to_db_task(mapping, ["employee"], db_conn=db_conn)
+    task.esc_db_col = escape_identifier_mssql
+
+    task.get_db_records(datetime(2024, 1, 1))
+
+    assert db_conn.queries[0][0] == "SELECT PersNr, Vorname, [Order], changed, id FROM employees WHERE changed >= ?"
+
+
 def test_compare_datetimes_honors_tolerance():
     dt1 = datetime(2024, 3, 3, 12, 0, 0, 50_000)  # +50ms
     dt2 = datetime(2024, 3, 3, 12, 0, 0, 0)
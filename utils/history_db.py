@@ -1,5 +1,6 @@
+import json
 import logging
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 from peewee import (
@@ -7,6 +8,7 @@ from peewee import (
     CharField,
     DatabaseProxy,
     DateTimeField,
+    FloatField,
     ForeignKeyField,
     Model,
     SqliteDatabase,
@@ -47,11 +49,24 @@ class TaskLog(BaseModel):
     message = TextField()
 
 
+class TaskRunMetric(BaseModel):
+    id = AutoField()
+    run = ForeignKeyField(TaskRun, backref="metrics", on_delete="CASCADE")
+    name = CharField()
+    value = FloatField()
+
+
 class SchedulerSettings(BaseModel):
     key = CharField(primary_key=True)
     value = TextField()
 
 
+class MetadataCache(BaseModel):
+    key = CharField(primary_key=True)
+    value = TextField()  # JSON
+    fetched_at = DateTimeField()
+
+
 class TaskHistoryDB:
     """
     SQLite-basierte Ablage für Sync-Zustände, Runs und Log-Einträge (per peewee).
@@ -67,7 +82,7 @@ class TaskHistoryDB:
         self.db.connect()
         # safe=True stellt sicher, dass wir auch bei bestehenden Tabellen
         # (z. B. nach einem Neustart) keine Fehler bekommen.
-        self.db.create_tables([SyncState, TaskRun, TaskLog, SchedulerSettings], safe=True)
+        self.db.create_tables([SyncState, TaskRun, TaskLog, TaskRunMetric, SchedulerSettings, MetadataCache], safe=True)
 
     def close(self):
         if not self.db.is_closed():
@@ -107,6 +122,35 @@ class TaskHistoryDB:
     def insert_log(self, run_id: int, level: str, message: str, created_at: datetime):
         TaskLog.create(run=run_id, created_at=created_at, level=level, message=message)
 
+    def save_run_metrics(self, run_id: int, metrics: dict[str, float]):
+        if metrics:
+            TaskRunMetric.insert_many([{"run": run_id, "name": k, "value": v} for k, v in metrics.items()]).execute()
+
+    def get_run_metrics(self, run_id: int) -> dict[str, float]:
+        rows = TaskRunMetric.select().where(TaskRunMetric.run == run_id).order_by(TaskRunMetric.id.asc())
+        return {row.name: row.value for row in rows}
+
+    def get_metadata(self, key: str, max_age_seconds: float):
+        """
+        Zwischengespeicherte Metadaten (z. B. Zeitzone oder DocType-Felder), falls jünger als `max_age_seconds`.
+        """
+        row = MetadataCache.get_or_none(MetadataCache.key == key)
+        if not row:
+            return None
+        if row.fetched_at < datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=max_age_seconds):
+            return None
+        return json.loads(row.value)
+
+    def save_metadata(self, key: str, value):
+        fetched_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        MetadataCache.insert(key=key, value=json.dumps(value), fetched_at=fetched_at).on_conflict(
+            conflict_target=[MetadataCache.key],
+            update={MetadataCache.value: json.dumps(value), MetadataCache.fetched_at: fetched_at},
+        ).execute()
+
+    def clear_metadata(self) -> int:
+        return MetadataCache.delete().execute()
+
     def _get_setting(self, key: str):
         row = SchedulerSettings.get_or_none(SchedulerSettings.key == key)
         return row.value if row else None
@@ -155,6 +199,7 @@ class TaskHistoryDB:
             "started_at": row.started_at,
             "finished_at": row.finished_at,
             "status": row.status,
+            "metrics": self.get_run_metrics(row.id),
         }
 
     def prune_runs(self, task_name: str, status: str, keep_last: int | None):
@@ -0,0 +1,94 @@
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import Iterable
+
+
+class Row(tuple):
+    """
+    Kompakter, unveränderlicher Datensatz: die Werte liegen in einem Tupel, die Spaltennamen einmal pro Zeilentyp.
+    Verhält sich lesend wie ein dict (row["feld"], get, keys, items, in), Iteration liefert die Spaltennamen.
+    Zeilentypen werden über `row_type(columns)` erzeugt und pro Spaltenliste wiederverwendet.
+    """
+
+    __slots__ = ()
+    _columns: tuple[str, ...] = ()
+    _index: dict[str, int] = {}
+
+    @classmethod
+    def from_values(cls, values: Iterable):
+        return tuple.__new__(cls, values)
+
+    @classmethod
+    def from_dict(cls, record: Mapping):
+        return tuple.__new__(cls, (record.get(column) for column in cls._columns))
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def get(self, key: str, default=None):
+        index = self._index.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def keys(self):
+        return self._columns
+
+    def values(self):
+        return tuple(tuple.__iter__(self))
+
+    def items(self):
+        return zip(self._columns, tuple.__iter__(self))
+
+    def as_dict(self) -> dict:
+        return dict(self.items())
+
+    def replace(self, values: Mapping):
+        """
+        Liefert eine neue Zeile desselben Typs, in der die angegebenen Spalten ersetzt sind.
+        """
+        return tuple.__new__(type(self), (values[c] if c in values else v for c, v in self.items()))
+
+    def __eq__(self, other):
+        if isinstance(other, Row):
+            return self._columns == other._columns and tuple.__eq__(self, other)
+        if isinstance(other, Mapping):
+            return self.as_dict() == dict(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = tuple.__hash__
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+
+Mapping.register(Row)
+
+
+@lru_cache(maxsize=None)
+def row_type(columns: tuple[str, ...]) -> type[Row]:
+    """
+    Zeilentyp für die gegebene Spaltenliste; der Spaltenindex wird von allen Zeilen des Typs geteilt.
+    """
+    return type("Row", (Row,), {"__slots__": (), "_columns": columns, "_index": {c: i for i, c in enumerate(columns)}})
+
+
+def decode_rows(records: list, columns: Iterable[str]) -> list[Row]:
+    """
+    Wandelt eine Liste aus Wertelisten (kompakte Antwort) oder dicts in Zeilen mit den angegebenen Spalten um.
+    """
+    cls = row_type(tuple(columns))
+    if records and isinstance(records[0], dict):
+        return [cls.from_dict(rec) for rec in records]
+    new = tuple.__new__
+    return [new(cls, rec) for rec in records]